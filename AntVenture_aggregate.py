@@ -0,0 +1,308 @@
+# Population-level (tau-leaping) engine for AntVenture: Sims
+# Ants have no identity: the colony is a set of compartment counts, advanced every second with binomial, multinomial
+# and hypergeometric draws using the same parameters as the individual-based model.
+#   nurses, naive foragers inside and outside the nest: counts by fed level (tenths of a full ant, 0-10)
+#   informed foragers at home: counts by liquid carried (units of fed_vol / 100, so that, as in the individual-based
+#   model, a forager keeps sharing until less than 0.1 is left)
+#   informed foragers walking, loading or returning: counts scheduled to arrive at a given second
+# Liquid is rounded stochastically to whole units (keeping the mean), and the number of different ants hit by
+# draws with replacement is taken from its expectation. The cost of a second does not depend on colony size.
+# Used through diacamma_model(..., engine="aggregate"); validate() compares it with the individual-based model.
+# Usage: python AntVenture_aggregate.py --n-sims 200
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from AntVenture_sims import spawn_generators, _tick
+
+ARRIVE_SOURCE, LEAVE_SOURCE, ARRIVE_NEST = 0, 1, 2
+levels = np.arange(11)  # fed level in tenths; 10 = fed
+per_level = 10  # units of liquid per fed level
+# fraction of the liquid passed by a social bucket feeder: uniform, more than 90% counts as everything (bin middles)
+u_pass = np.append(np.arange(0.05, 0.9, 0.1), 1)
+
+
+def create_colony_aggregate(N, Nf, Q):
+    # Q: most units of liquid a forager can carry
+    st = {"nur": np.zeros(11, dtype=np.int64), "nin": np.zeros(11, dtype=np.int64),
+          "nout": np.zeros(11, dtype=np.int64), "home": np.zeros(Q + 1, dtype=np.int64), "N": N,
+          "walking": 0, "source": 0, "returning": 0, "informed": 0, "events": {}}
+    st["nur"][0] = N - Nf
+    st["nin"][0] = Nf
+    return st
+
+
+def _schedule(st, t, kind, n):
+    if n > 0:
+        st["events"].setdefault(t, np.zeros(3, dtype=np.int64))[kind] += n
+
+
+def _n_hungry(st):
+    return int(st["nur"][:10].sum() + st["nin"][:10].sum())
+
+
+def _pick(st, k, rng):
+    # k hungry ants taken at random out of the nest compartments: counts by (nurse / naive forager, level)
+    hungry = np.concatenate([st["nur"][:10], st["nin"][:10]])
+    picked = rng.multivariate_hypergeometric(hungry, k).reshape(2, 10)
+    st["nur"][:10] -= picked[0]
+    st["nin"][:10] -= picked[1]
+    return picked
+
+
+def _put(st, new):
+    # new: counts by (nurse / naive forager, level), levels above 10 already resolved
+    st["nur"] += new[0]
+    st["nin"] += new[1]
+
+
+def _distinct(m, n, rng):
+    # number of different ants among m draws with replacement out of n (expectation, rounded stochastically)
+    e = n * -np.expm1(m * np.log1p(-1 / n)) if n > 1 else min(m, n)
+    return int(min(np.floor(e) + (rng.random() < e - np.floor(e)), m, n))
+
+
+def _split_round(x, count, rng):
+    # count ants each with the real amount x: how many get floor(x) and how many floor(x) + 1 (mean kept)
+    lo = np.floor(x).astype(np.int64)
+    up = rng.binomial(count, x - lo)
+    return np.broadcast_to(lo, up.shape), count - up, up
+
+
+def _feed_trophallaxis_agg(st, par, rng, prof=None):
+    # all loaded foragers at home; returns False if nobody was hungry in the nest
+    home = st["home"]
+    n_empty = _n_hungry(st)
+    if n_empty == 0:
+        return False
+    act = np.zeros_like(home)
+    act[1:] = rng.binomial(home[1:], par["p_feed_t"] * n_empty / st["N"])
+    fed_vol = 10 * per_level
+    n_full = int(act[fed_vol:].sum())
+    if n_full > 0:  # each gives one fed volume to a different hungry ant
+        k = min(n_full, n_empty)
+        picked = _pick(st, k, rng)
+        st["nur"][10] += picked[0].sum()
+        st["nin"][10] += picked[1].sum()
+        moved = rng.multivariate_hypergeometric(act[fed_vol:], k)
+        home[fed_vol:] -= moved
+        home[:len(moved)] += moved
+        if prof is not None:
+            prof["events"]["feedings"] += k
+    elif act.any():  # only partial loads: the ants drawn get what one of them carries
+        m = int(act.sum())
+        k = _distinct(m, n_empty, rng)
+        q = rng.choice(len(act), p=act / m) / per_level
+        level = int(q) + (rng.random() < q - int(q))
+        picked = _pick(st, k, rng)
+        st["nur"][level] += picked[0].sum()
+        st["nin"][level] += picked[1].sum()
+        home -= act
+        home[0] += m
+        if prof is not None:
+            prof["events"]["feedings"] += k
+    return True
+
+
+def _add_portions(st, portions, method_sb, rng, prof=None):
+    # portions: counts by size (fed levels); each goes to a different hungry ant, paired at random
+    k = int(portions.sum())
+    if k == 0:
+        return
+    picked = _pick(st, k, rng)
+    J = len(portions)
+    new = np.zeros((2, 10 + J), dtype=np.int64)
+    pool = portions.copy()
+    for c, lv in zip(*np.nonzero(picked)):
+        got = rng.multivariate_hypergeometric(pool, picked[c, lv])
+        pool -= got
+        new[c, lv:lv + J] += got
+    over = new[:, 11:]
+    if method_sb == "complex":
+        q_over = int((over * np.arange(1, J)).sum())
+        n_over = int(over.sum())
+    new[:, 10] += over.sum(axis=1)  # more than 90% (simple) or overfed (complex): fed
+    _put(st, new[:, :11])
+    if prof is not None:
+        prof["events"]["feedings"] += k
+    if method_sb != "complex" or n_over == 0:
+        return
+    # overfed ants pass the excess to random hungry ants, nobody receives more than 1
+    n_recv = _n_hungry(st)
+    if n_recv == 0:
+        return
+    k = _distinct(n_over, n_recv, rng)
+    picked = _pick(st, k, rng)
+    lo, n_lo, n_up = _split_round(q_over / k, picked, rng)
+    new = np.zeros((2, 11), dtype=np.int64)
+    for c in range(2):
+        np.add.at(new[c], np.minimum(levels[:10] + lo[c], 10), n_lo[c])
+        np.add.at(new[c], np.minimum(levels[:10] + lo[c] + 1, 10), n_up[c])
+    _put(st, new)
+    if prof is not None:
+        prof["events"]["redistributions"] += n_over
+
+
+def _feed_social_bucket_agg(st, first, method_sb, rng, prof=None):
+    # loaded foragers at home carrying at least `first` units
+    home = st["home"]
+    n_empty = _n_hungry(st)
+    if n_empty == 0:
+        return False
+    feeders = home.copy()
+    feeders[:first] = 0
+    f = np.arange(1, 4)  # each forager feeds 1-3 ants at once
+    act = rng.binomial(rng.multinomial(feeders, [1 / 3] * 3), 1 / (2 / (n_empty / st["N"]) + 0.524 * f))
+    n = rng.multinomial(act, [0.1] * 10)  # (liquid, ants fed at once, fraction passed)
+    q = np.arange(len(home))[:, None, None]
+    passed = q * u_pass
+    # feeders keep the rest of their liquid
+    home -= act.sum(axis=1)
+    lo, n_lo, n_up = _split_round(q - passed, n, rng)
+    np.add.at(home, lo, n_lo)
+    np.add.at(home, lo + 1, n_up)
+    # amount passed is divided by the numbers of individuals engaged with each forager (in fed levels)
+    lo, n_lo, n_up = _split_round(passed / f[:, None] / per_level, n * f[:, None], rng)
+    size = len(home) // per_level + 2
+    portions = np.bincount(lo.ravel(), n_lo.ravel(), minlength=size)
+    portions[1:] += np.bincount(lo.ravel(), n_up.ravel(), minlength=size - 1)
+    portions = portions.astype(np.int64)
+    if portions.sum() > n_empty:  # cannot feed more ants than there are hungry ones
+        portions = rng.multivariate_hypergeometric(portions, n_empty)
+    _add_portions(st, portions, method_sb, rng, prof)
+    return True
+
+
+def feed_in_nest_aggregate(st, par, behavior, method_sb, rng, prof=None):
+    t0 = time.perf_counter() if prof is not None else None
+    if behavior == 1:
+        _feed_trophallaxis_agg(st, par, rng, prof)
+        phase = "2.1 trophallaxis"
+    elif behavior == 0:
+        _feed_social_bucket_agg(st, 1, method_sb, rng, prof)
+        phase = "2.2 social bucket"
+    else:  # social bucket while anybody carries more than trophallaxis can, trophallaxis after
+        v_t = par["units"]["v_t"]
+        if st["home"][v_t + 1:].any():
+            _feed_social_bucket_agg(st, v_t + 1, method_sb, rng, prof)
+        else:
+            _feed_trophallaxis_agg(st, par, rng, prof)
+        phase = "2.3 trophallaxis + SB"
+    if prof is not None:
+        _tick(prof, phase, t0)
+
+
+def model_step_aggregate(st, par, behavior, method_sb, rng, t, prof=None):
+    t0 = time.perf_counter() if prof is not None else None
+    u = par["units"]
+    nin, nout, home = st["nin"], st["nout"], st["home"]
+    out = nout.copy()  # naive ants outside before anybody moves
+    # 1.1 see if naif go out
+    go = rng.binomial(nin, par["p_out"])
+    nin -= go
+    nout += go
+    # 1.2. informed empty ants go out
+    _schedule(st, t + u["dist"], ARRIVE_SOURCE, home[0])
+    st["walking"] += home[0]
+    home[0] = 0
+    if prof is not None:
+        _tick(prof, "1 nest exit", t0)
+    # 2- TROPHALLAXIS & SOCIAL BUCKET INSIDE NEST
+    if home.any():
+        feed_in_nest_aggregate(st, par, behavior, method_sb, rng, prof)
+    t0 = time.perf_counter() if prof is not None else None
+    # 3.1 Naif ants outside go back or find the source
+    back = rng.binomial(out, par["p_nest"])
+    found = rng.binomial(out - back, par["p_source"])
+    nout -= back + found
+    nin += back
+    n = int(found.sum())
+    st["informed"] += n
+    st["source"] += n
+    _schedule(st, t + u["t_load"], LEAVE_SOURCE, n)
+    if prof is not None:
+        t0 = _tick(prof, "3.1 exploration", t0)
+    # 3.2, 4 and 5: travels and loading ending now
+    ev = st["events"].pop(t, None)
+    if ev is not None:
+        arrive, leave, nest = (int(e) for e in ev)
+        st["walking"] -= arrive
+        st["source"] += arrive - leave
+        _schedule(st, t + u["t_load"], LEAVE_SOURCE, arrive)
+        st["returning"] += leave - nest
+        _schedule(st, t + u["dist"], ARRIVE_NEST, leave)
+        drop = rng.binomial(nest, par["p_drop"][behavior])  # social bucket may drop the liquid on the way
+        home[u["volume"]] += nest - drop
+        home[u["volume"] - u["v_sb"] if behavior == 2 else 0] += drop
+        if prof is not None:
+            prof["events"]["drops"] += int(drop)
+            _tick(prof, "events (3.2, 4, 5)", t0)
+
+
+def record_results_aggregate(st, t, colony):
+    nest = st["nur"] + st["nin"]
+    fed = ((nest + st["nout"]) @ levels) / 10 + st["informed"]
+    inside = nest.sum() + st["home"].sum()
+    outside = st["nout"].sum() + st["walking"] + st["returning"]
+    return np.array([[fed, inside, outside, st["source"], st["informed"], t, colony]], dtype=float)
+
+
+def simulate_aggregate(N, Nf, time_sim, par, behavior=1, method_sb="simple", n_sims=1, batched=True, seed=None,
+                       stop=None, prof=None, record_every=10, trajectory=None):
+    # same interface and output as AntVenture_sims.simulate, one colony at a time (batched is ignored); there are no
+    # individual ants to record in a trajectory
+    N, time_sim, n_sims = int(N), int(time_sim), int(n_sims)
+    Nf = min(int(Nf), N)  # cannot have more foragers than ants
+    unit = par["fed_vol"] / 10 / per_level
+    par = dict(par, units={"volume": int(np.rint(par["volume"][behavior] / unit)),
+                           "v_sb": int(np.rint(par["v_sb"] / unit)), "v_t": int(np.rint(par["v_t"] / unit)),
+                           "t_load": int(par["t_load"][behavior]) + 1, "dist": int(par["dist"][behavior]) + 1})
+    if n_sims == 0:  # one empty block, as the batched engines
+        yield np.zeros((0, 7))
+        return
+    for colony, rng in enumerate(spawn_generators(seed, n_sims)):
+        st = create_colony_aggregate(N, Nf, par["units"]["volume"])
+        for t in range(0, time_sim + 1):
+            if t > 0:
+                model_step_aggregate(st, par, behavior, method_sb, rng, t, prof)
+            if t % record_every == 0:
+                t0 = time.perf_counter() if prof is not None else None
+                res = record_results_aggregate(st, t, colony)
+                if prof is not None:
+                    _tick(prof, "record", t0)
+                yield res
+                if stop is not None and stop(res[0]):
+                    break
+
+
+def validate(configs=None, time_sim=2000, n_sims=200, seed=0, alpha=0.01, reference="step"):
+    # time to 50% fed of the aggregate engine against the individual-based model (KS test per configuration)
+    from AntVenture_bench import bench_configs, equivalence
+    configs = configs or bench_configs(N=(20, 80, 1000), D=(20, 100))
+    return equivalence("aggregate", configs, time_sim, n_sims, seed, alpha, reference)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate the aggregate engine against the individual-based model.")
+    parser.add_argument('--N', nargs='+', type=int, default=[20, 80, 1000])
+    parser.add_argument('--D', nargs='+', type=int, default=[20, 100])
+    parser.add_argument('--behavior', nargs='+', type=int, default=[0, 1, 2])
+    parser.add_argument('--method-sb', nargs='+', default=["simple", "complex"])
+    parser.add_argument('--time-sim', type=int, default=2000)
+    parser.add_argument('--n-sims', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--alpha', type=float, default=0.01)
+    args = parser.parse_args(argv)
+    from AntVenture_bench import bench_configs
+    res = validate(bench_configs(args.N, args.D, args.behavior, args.method_sb), args.time_sim, args.n_sims,
+                   args.seed, args.alpha)
+    print(res.to_string(index=False))
+    if not res['equivalent'].all():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
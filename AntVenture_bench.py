@@ -0,0 +1,126 @@
+# Benchmarks for AntVenture: Sims
+# time: wall time and peak memory of diacamma_model across colony size, distance, behaviour and method_sb
+# equivalence: compares the distribution of the time to 50% fed of an engine against the reference ("step") engine
+# Usage: python AntVenture_bench.py time --output bench.csv [--baseline old_bench.csv]
+#        python AntVenture_bench.py equivalence --engine events
+
+import argparse
+import io
+import itertools
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+
+from AntVenture_sims import diacamma_model, engines, iter_diacamma_model, stop_when_fed
+
+bench_columns = ['engine', 'N', 'D', 'behavior', 'method_sb', 'n_sims', 'time_sim', 'wall', 'peak_mb']
+
+
+def bench_configs(N=(20, 80, 160, 1000), D=(20, 100, 500), behavior=(0, 1, 2), method_sb=("simple", "complex")):
+    # method_sb only matters for social bucket (0) and both (2)
+    return [c for c in itertools.product(N, D, behavior, method_sb) if c[2] != 1 or c[3] == "simple"]
+
+
+def time_model(N, D, behavior, method_sb, time_sim=1000, n_sims=1, engine="step", repeat=3, Nf=None, sugar=0.3):
+    # best wall time over `repeat` runs, and peak memory allocated during one run (in MB)
+    Nf = Nf or max(N // 4, 1)
+    kwargs = dict(N=N, Nf=Nf, D=D, time_sim=time_sim, sugar=sugar, behavior=behavior, method_sb=method_sb,
+                  n_sims=n_sims, engine=engine)
+    wall = np.inf
+    for r in range(repeat):
+        with redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            diacamma_model(seed=r, **kwargs)
+            wall = min(wall, time.perf_counter() - t0)
+    tracemalloc.start()
+    with redirect_stdout(io.StringIO()):
+        diacamma_model(seed=0, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return wall, peak
+
+
+def run_benchmarks(configs, time_sim=1000, n_sims=1, engines_=("step",), repeat=3, progress=True):
+    out = []
+    for engine in engines_:
+        for N, D, behavior, method_sb in configs:
+            wall, peak = time_model(N, D, behavior, method_sb, time_sim, n_sims, engine, repeat)
+            out.append([engine, N, D, behavior, method_sb, n_sims, time_sim, wall, peak])
+            if progress:
+                sys.stderr.write("%s N=%d D=%d behavior=%d %s: %.3fs %.1fMB\n" % (engine, N, D, behavior, method_sb,
+                                                                                 wall, peak))
+    return pd.DataFrame(out, columns=bench_columns)
+
+
+def time_to_fed(N, Nf, D, time_sim, behavior, method_sb, n_sims, seed, engine="step", fraction=0.5, sugar=0.3,
+                terrain=0):
+    # time at which `fraction` of the colony is fed for each replicate; colonies that never get there are censored
+    # at time_sim (second value returned: True if reached)
+    rows, warn = iter_diacamma_model(N, Nf, D, time_sim, sugar=sugar, behavior=behavior, terrain=terrain,
+                                     method_sb=method_sb, n_sims=n_sims, seed=seed, engine=engine,
+                                     stop=stop_when_fed(N, fraction))
+    last = {}
+    for row in rows:
+        last[row[6]] = row
+    last = np.array([last[c] for c in sorted(last)])
+    return last[:, 5], last[:, 0] >= int(N * fraction)
+
+
+def equivalence(engine, configs, time_sim=2000, n_sims=200, seed=0, alpha=0.01, reference="step"):
+    # two-sample Kolmogorov-Smirnov test on the time to 50% fed, per configuration; independent seeds per engine
+    from scipy import stats
+    out = []
+    ref_seed, new_seed = np.random.SeedSequence(seed).spawn(2)
+    for N, D, behavior, method_sb in configs:
+        Nf = max(N // 4, 1)
+        ref, ref_ok = time_to_fed(N, Nf, D, time_sim, behavior, method_sb, n_sims, ref_seed, reference)
+        new, new_ok = time_to_fed(N, Nf, D, time_sim, behavior, method_sb, n_sims, new_seed, engine)
+        p = stats.ks_2samp(ref, new).pvalue
+        out.append([engine, N, D, behavior, method_sb, ref.mean(), new.mean(), ref_ok.mean(), new_ok.mean(), p,
+                    p >= alpha])
+    return pd.DataFrame(out, columns=['engine', 'N', 'D', 'behavior', 'method_sb', 'mean_ref', 'mean_new',
+                                      'reached_ref', 'reached_new', 'p_value', 'equivalent'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for diacamma_model.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name in ('time', 'equivalence'):
+        p = sub.add_parser(name)
+        p.add_argument('--N', nargs='+', type=int, default=[20, 80, 160, 1000] if name == 'time' else [20, 80])
+        p.add_argument('--D', nargs='+', type=int, default=[20, 100, 500] if name == 'time' else [20, 100])
+        p.add_argument('--behavior', nargs='+', type=int, default=[0, 1, 2])
+        p.add_argument('--method-sb', nargs='+', default=["simple", "complex"])
+        p.add_argument('--time-sim', type=int, default=1000 if name == 'time' else 2000)
+        p.add_argument('--n-sims', type=int, default=1 if name == 'time' else 200)
+        p.add_argument('--output', default=None)
+    sub.choices['time'].add_argument('--engine', nargs='+', choices=engines, default=["step"])
+    sub.choices['time'].add_argument('--repeat', type=int, default=3)
+    sub.choices['time'].add_argument('--baseline', default=None, help="previous --output to compare against")
+    sub.choices['equivalence'].add_argument('--engine', choices=engines, default="events")
+    sub.choices['equivalence'].add_argument('--seed', type=int, default=0)
+    sub.choices['equivalence'].add_argument('--alpha', type=float, default=0.01)
+    args = parser.parse_args(argv)
+    configs = bench_configs(args.N, args.D, args.behavior, args.method_sb)
+    if args.command == 'time':
+        res = run_benchmarks(configs, args.time_sim, args.n_sims, args.engine, args.repeat)
+        if args.baseline:
+            keys = bench_columns[:7]
+            old = pd.read_csv(args.baseline)[keys + ['wall']].rename(columns={'wall': 'wall_baseline'})
+            res = res.merge(old, on=keys, how='left')
+            res['speedup'] = res['wall_baseline'] / res['wall']
+    else:
+        res = equivalence(args.engine, configs, args.time_sim, args.n_sims, args.seed, args.alpha)
+    if args.output:
+        res.to_csv(args.output, index=False)
+    print(res.to_string(index=False))
+    if args.command == 'equivalence' and not res['equivalent'].all():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# Result cache for AntVenture: Sims
+# Runs are stored under a hash of their normalised parameters: sugar is replaced by the viscosity, t_t and v_t it
+# gives (as every other input, by the model parameters it produces), together with the model version, engine and seed,
+# so equivalent inputs share an entry. Two tiers: an in-memory LRU and an on-disk directory with a size cap (least
+# recently used files are evicted first).
+# Usage: cache = open_cache("antventure_cache"); results, warning = cached_diacamma_model(cache, 80, 20, 100, 600, sugar=0.3, seed=1)
+#        run_sweep(combi, seed=1, cache=cache)
+
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+
+from AntVenture_sims import canonical_seed, check_model, diacamma_model, model_version, resolve_engine
+
+default_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "antventure")
+
+
+def open_cache(path=default_cache_dir, max_bytes=2 * 2 ** 30, max_items=256):
+    # path=None keeps results in memory only; max_bytes caps the disk tier, max_items the memory tier
+    cache = {"memory": OrderedDict(), "path": path, "max_bytes": max_bytes, "max_items": max_items, "hits": 0,
+             "misses": 0, "bytes": 0}
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+        cache["bytes"] = sum(f[1] for f in _files(cache))  # running total of the disk tier, kept up to date by cache_put
+    return cache
+
+
+def canonical(value):
+    # JSON-able and stable: floats rounded to 12 significant digits, arrays as lists (cache keys, sweep manifests)
+    if isinstance(value, dict):
+        return {str(k): canonical(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [canonical(v) for v in value]
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return float("%.12g" % value)
+    return str(value)
+
+
+def canonical_parameters(N, Nf, D, time_sim, visco='NA', sugar='NA', behavior=1, terrain=0, method_sb="simple",
+                         engine="step"):
+    # the model inputs as the model sees them; (None, warning) for invalid inputs
+    par, warning_message = check_model(D, visco, sugar, behavior, terrain, method_sb, engine)
+    if par is None:
+        return None, warning_message
+    params = {"N": int(N), "Nf": min(int(Nf), int(N)), "time_sim": int(time_sim), "behavior": int(behavior),
+              "method_sb": method_sb if behavior != 1 else "simple",  # trophallaxis does not use method_sb
+              "engine": resolve_engine(engine), "par": {k: v for k, v in par.items() if np.isscalar(v)}}
+    return params, warning_message
+
+
+def cache_key(kind, params, seed):
+    # sha256 of the normalised parameters, model version and seed; None if the run cannot be cached
+    seed = canonical_seed(seed)
+    if params is None or seed is None:
+        return None
+    blob = json.dumps(canonical({"kind": kind, "version": model_version, "params": params, "seed": seed}),
+                      sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def _file(cache, key):
+    return os.path.join(cache["path"], key + ".pkl")
+
+
+def cache_get(cache, key):
+    # stored value or None; disk hits are promoted to memory, and their file marked as recently used
+    if key is None:
+        return None
+    memory = cache["memory"]
+    if key in memory:
+        memory.move_to_end(key)
+        cache["hits"] += 1
+        return memory[key]
+    if cache["path"] is not None and os.path.exists(_file(cache, key)):
+        try:
+            with open(_file(cache, key), "rb") as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):  # evicted meanwhile or partly written
+            value = None
+        if value is not None:
+            os.utime(_file(cache, key))
+            _remember(cache, key, value)
+            cache["hits"] += 1
+            return value
+    cache["misses"] += 1
+    return None
+
+
+def _remember(cache, key, value):
+    memory = cache["memory"]
+    memory[key] = value
+    memory.move_to_end(key)
+    while len(memory) > cache["max_items"]:
+        memory.popitem(last=False)
+
+
+def cache_put(cache, key, value):
+    if key is None:
+        return
+    _remember(cache, key, value)
+    if cache["path"] is None:
+        return
+    tmp = _file(cache, key) + ".%d.tmp" % os.getpid()  # other processes never see a partial file
+    with open(tmp, "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    size = os.path.getsize(tmp)
+    try:
+        size -= os.path.getsize(_file(cache, key))  # replaced entry
+    except OSError:
+        pass
+    os.replace(tmp, _file(cache, key))
+    cache["bytes"] += size
+    if cache["bytes"] > cache["max_bytes"]:  # the directory is only listed when it may be over the cap
+        _evict(cache)
+
+
+def _files(cache):
+    # (mtime, size, name) of the entries of the disk tier
+    files = []
+    for name in os.listdir(cache["path"]):
+        if name.endswith(".pkl"):
+            try:
+                st = os.stat(os.path.join(cache["path"], name))
+            except OSError:  # removed meanwhile by another process
+                continue
+            files.append((st.st_mtime, st.st_size, name))
+    return files
+
+
+def _evict(cache):
+    # remove least recently used files until the disk tier fits in max_bytes; the scan also corrects the running
+    # total for files written or removed by other processes
+    files = _files(cache)
+    total = sum(f[1] for f in files)
+    for mtime, size, name in sorted(files):
+        if total <= cache["max_bytes"]:
+            break
+        try:
+            os.remove(os.path.join(cache["path"], name))
+        except OSError:
+            pass
+        total -= size
+    cache["bytes"] = total
+
+
+def clear_cache(cache):
+    cache["memory"].clear()
+    if cache["path"] is not None:
+        for name in os.listdir(cache["path"]):
+            if name.endswith(".pkl"):
+                os.remove(os.path.join(cache["path"], name))
+    cache["bytes"] = 0
+
+
+def cached_diacamma_model(cache, N, Nf, D, time_sim, visco='NA', sugar='NA', behavior=1, terrain=0,
+                          method_sb="simple", n_sims=1, batched=True, seed=None, engine="step", record_every=10):
+    # diacamma_model through the cache; unseeded runs (or seeded with a Generator) are always simulated
+    params, warning_message = canonical_parameters(N, Nf, D, time_sim, visco, sugar, behavior, terrain, method_sb,
+                                                   engine)
+    if params is None:
+        return None, warning_message
+    params.update(n_sims=int(n_sims), batched=bool(batched), record_every=int(record_every))
+    key = cache_key("diacamma_model", params, seed)
+    fin_res = cache_get(cache, key)
+    if fin_res is None:
+        fin_res, warning_message = diacamma_model(N, Nf, D, time_sim, visco, sugar, behavior, terrain, method_sb,
+                                                  n_sims, batched, seed, engine, record_every=record_every)
+        if fin_res is None:
+            return None, warning_message
+        cache_put(cache, key, fin_res)
+    return fin_res.copy(), warning_message
@@ -0,0 +1,168 @@
+# Event-driven (next-event time advance) engine for AntVenture: Sims
+# Walking between nest and source and loading at the source are deterministic countdowns: instead of scanning every
+# forager every second, each of these transitions is scheduled in a priority queue of future events. Only the
+# stochastic parts (naive exploration, feeding inside the nest) are sampled every second, and the seconds where
+# nothing stochastic can happen are skipped up to the next event.
+# Used through diacamma_model(..., engine="events"); outputs match the step engine statistically.
+
+import heapq
+import time
+
+import numpy as np
+
+from AntVenture_sims import (create_colony, record_results, spawn_generators, feed_in_nest, _capture, _draw, _next_stop,
+                             _tick)
+
+# events of the same second are processed in this order, as phases 3.2, 4 and 5 of the step engine
+ARRIVE_SOURCE, LEAVE_SOURCE, ARRIVE_NEST = 0, 1, 2
+
+
+def _schedule(queue, events, t, kind, colonies, ants):
+    # queue: heap of the seconds with pending events; events[t][kind]: list of (colonies, ants) arrays
+    if len(ants) == 0:
+        return
+    if t not in events:
+        events[t] = ([], [], [])
+        heapq.heappush(queue, t)
+    events[t][kind].append((colonies, ants))
+
+
+def _schedule_by(queue, events, t, kind, colonies, ants, delay):
+    # as _schedule, with one delay per ant (ants of different behaviours travel and load at different speeds)
+    for d in np.unique(delay):
+        sel = delay == d
+        _schedule(queue, events, t + int(d), kind, colonies[sel], ants[sel])
+
+
+def _pop(events, t, kind, row_of):
+    # ants of the event at time t as (rows, cols) of the current colony table; stopped colonies are dropped
+    if not events[t][kind]:
+        return None
+    colonies = np.concatenate([e[0] for e in events[t][kind]])
+    ants = np.concatenate([e[1] for e in events[t][kind]])
+    rows = row_of[colonies]
+    keep = rows >= 0
+    return rows[keep], ants[keep]
+
+
+def _event_step(dat, Nf, par, method_sb, rng, t, queue, events, colonies, row_of, prof=None):
+    t0 = time.perf_counter() if prof is not None else None
+    fw, fn, qliquid = dat["where"][:, :Nf], dat["naif"][:, :Nf], dat["qliquid"][:, :Nf]
+    t_load, dist = par["t_load"] + 1, par["dist"] + 1  # delays, indexed by behav
+    # stochastic phases, same as model_step
+    Nf_in = (fw == 0) & (fn == 0)  # who is in nest and naif
+    Nf_out = (fw == 1) & (fn == 0)  # who is outside and naif
+    fb = dat["behav"][:, :Nf]
+    loaded = (fw == 0) & (fn == 1) & (qliquid > 0)  # foragers with liquid to share
+    # 1.1 see if naif go out
+    if Nf_in.any():
+        fw[_draw(Nf_in, par["p_out"], rng)] = 1
+    # 1.2. informed empty ants go out, they arrive to the source after dist + 1 seconds
+    temp = (fw == 0) & (fn == 1) & (qliquid == 0)
+    if temp.any():
+        fw[temp] = 1
+        rows, cols = np.nonzero(temp)
+        _schedule_by(queue, events, t, ARRIVE_SOURCE, colonies[rows], cols, dist[fb[rows, cols]])
+    if prof is not None:
+        _tick(prof, "1 nest exit", t0)
+    # 2- TROPHALLAXIS & SOCIAL BUCKET INSIDE NEST
+    if loaded.any():
+        feed_in_nest(dat, loaded & (fb == 1), loaded & (fb == 0), loaded & (fb == 2), par, method_sb, rng, prof)
+    t0 = time.perf_counter() if prof is not None else None
+    # 3.1 Naif ants outside, those finding the source leave it loaded after t_load + 1 seconds
+    if Nf_out.any():
+        back = _draw(Nf_out, par["p_nest"], rng)
+        fw[back] = 0
+        temp = _draw(Nf_out & ~back, par["p_source"], rng)
+        fw[temp] = 2
+        fn[temp] = 1
+        dat["fed"][:, :Nf][temp] = 1
+        rows, cols = np.nonzero(temp)
+        _schedule_by(queue, events, t, LEAVE_SOURCE, colonies[rows], cols, t_load[fb[rows, cols]])
+    if prof is not None:
+        t0 = _tick(prof, "3.1 exploration", t0)
+    # deterministic phases: only the ants whose countdown ends now
+    if queue and queue[0] == t:
+        heapq.heappop(queue)
+        # 3.2 informed ants arrive to the source
+        ants = _pop(events, t, ARRIVE_SOURCE, row_of)
+        if ants is not None:
+            fw[ants] = 2
+            _schedule_by(queue, events, t, LEAVE_SOURCE, colonies[ants[0]], ants[1], t_load[fb[ants]])
+        # 4 full ants leave the source
+        ants = _pop(events, t, LEAVE_SOURCE, row_of)
+        if ants is not None:
+            fw[ants] = 3
+            qliquid[ants] = par["volume"][fb[ants]]
+            _schedule_by(queue, events, t, ARRIVE_NEST, colonies[ants[0]], ants[1], dist[fb[ants]])
+        # 5 ants get back into the nest, social bucket may have dropped the liquid on the way
+        ants = _pop(events, t, ARRIVE_NEST, row_of)
+        if ants is not None:
+            fw[ants] = 0
+            sb = fb[ants] != 1  # social bucket may drop the liquid on the way, one draw for all of them
+            if sb.any():
+                ants = (ants[0][sb], ants[1][sb])
+                b = fb[ants]
+                drop = rng.random(len(b)) < par["p_drop"][b]
+                qliquid[ants[0][drop & (b == 0)], ants[1][drop & (b == 0)]] = 0
+                qliquid[ants[0][drop & (b == 2)], ants[1][drop & (b == 2)]] -= par["v_sb"]
+                if prof is not None:
+                    prof["events"]["drops"] += int(np.count_nonzero(drop))
+        del events[t]
+        if prof is not None:
+            _tick(prof, "events (3.2, 4, 5)", t0)
+
+
+def _idle(dat, Nf):
+    # no naive forager, no informed ant about to leave the nest and nobody able to share food inside the nest
+    # (loaded ants stay put when there is nobody left to feed): only scheduled events can change the colonies
+    fw, fn = dat["where"][:, :Nf], dat["naif"][:, :Nf]
+    if (fn == 0).any():
+        return False
+    home = (fw == 0) & (fn == 1)
+    if not home.any():
+        return True
+    if (home & (dat["qliquid"][:, :Nf] == 0)).any():
+        return False
+    hungry = ((dat["fed"] < 1) & (dat["where"] == 0)).any(axis=1)
+    return not (home.any(axis=1) & hungry).any()
+
+
+def simulate_events(N, Nf, time_sim, par, behavior=1, method_sb="simple", n_sims=1, batched=True, seed=None,
+                    stop=None, prof=None, record_every=10, trajectory=None):
+    # same interface and output as AntVenture_sims.simulate: a block of results rows every record_every seconds
+    N, time_sim, n_sims = int(N), int(time_sim), int(n_sims)
+    Nf = min(int(Nf), N)  # cannot have more foragers than ants
+    batches = [np.arange(n_sims)] if batched else np.arange(n_sims)[:, None]
+    for colonies, rng in zip(batches, spawn_generators(seed, len(batches))):
+        dat = create_colony(N, Nf, behavior, len(colonies))
+        row_of = np.full(n_sims, -1)  # colony -> row of the colony table
+        row_of[colonies] = np.arange(len(colonies))
+        queue, events = [], {}
+        t = 0
+        while True:
+            if trajectory is not None and t % trajectory["every"] == 0:
+                _capture(trajectory, dat, t, colonies)
+            if t % record_every == 0:
+                t0 = time.perf_counter() if prof is not None else None
+                res = record_results(dat, t, colonies)
+                if prof is not None:
+                    _tick(prof, "record", t0)
+                yield res
+                if stop is not None:
+                    running = np.array([not stop(row) for row in res], dtype=bool)
+                    if not running.all():  # finished colonies leave the batch, their events are dropped
+                        colonies = colonies[running]
+                        dat = {c: v[running] for c, v in dat.items()}
+                        row_of[:] = -1
+                        row_of[colonies] = np.arange(len(colonies))
+                        if len(colonies) == 0:
+                            break
+            if t >= time_sim:
+                break
+            t_next = t + 1
+            if _idle(dat, Nf):  # jump to the next event, or to the next record
+                t_next = max(t_next, min(queue[0] if queue else time_sim, _next_stop(t, record_every, trajectory,
+                                                                                     time_sim)))
+            t = t_next
+            _event_step(dat, Nf, par, method_sb, rng, t, queue, events, colonies, row_of, prof)
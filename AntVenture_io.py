@@ -0,0 +1,138 @@
+# Columnar, chunked result files for AntVenture: Sims
+# Results (parameter columns + fed, inside, outside, source, informed, time, colony) are streamed to a directory of
+# chunks with compact dtypes, and read back column by column:
+#   npy: one .npy file per column and chunk, memory-mapped on reading (no extra dependency)
+#   parquet: one .parquet file per chunk (needs pyarrow)
+# meta.json lists the columns, dtypes and chunks, with the min/max of every column per chunk, so that reading a
+# parameter slice skips the chunks that cannot contain it.
+# Usage: writer = open_writer("sweep_out"); write_rows(writer, block); ...; close_writer(writer)
+#        read_results("sweep_out", columns=["fed", "time"], where={"behaviortsb": 0, "sugarcon": [0.1, 0.3]})
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+formats = ("npy", "parquet")
+# compact dtypes of the known columns, anything else is stored as float64
+column_dtypes = {"colonysize": np.int32, "propforagers": np.int32, "distancesource": np.int32, "terraindiff": np.int8,
+                 "sugarcon": np.float32, "behaviortsb": np.int8, "fed": np.float32, "inside": np.int32,
+                 "outside": np.int32, "source": np.int32, "informed": np.int32, "time": np.int32,
+                 "colony": np.int32}
+
+
+def open_writer(path, columns, format="npy", chunk_rows=2 ** 20, attrs=None):
+    # path: directory (created); columns: names of the columns of the arrays passed to write_rows
+    if format not in formats:
+        raise ValueError("please choose a format: " + ", ".join("'%s'" % f for f in formats))
+    if format == "parquet":
+        import pyarrow  # noqa: F401 -- fail now rather than at the first chunk
+    os.makedirs(path, exist_ok=True)
+    dtypes = {c: np.dtype(column_dtypes.get(c, np.float64)) for c in columns}
+    return {"path": path, "columns": list(columns), "dtypes": dtypes, "format": format, "chunk_rows": int(chunk_rows),
+            "buffer": [], "buffered": 0, "chunks": [], "attrs": dict(attrs or {})}
+
+
+def write_rows(writer, rows):
+    # rows: 2-D array (columns in writer order) or DataFrame; written to disk every chunk_rows rows
+    if isinstance(rows, pd.DataFrame):
+        rows = rows[writer["columns"]].to_numpy()
+    if len(rows) == 0:
+        return
+    writer["buffer"].append(np.asarray(rows))
+    writer["buffered"] += len(rows)
+    if writer["buffered"] >= writer["chunk_rows"]:
+        _flush(writer)
+
+
+def _flush(writer, last=False):
+    # writes full chunks; what remains stays in the buffer until the last flush
+    if writer["buffered"] == 0:
+        return
+    rows = np.vstack(writer["buffer"])
+    n = len(rows) if last else len(rows) - len(rows) % writer["chunk_rows"]
+    writer["buffer"], writer["buffered"] = [rows[n:]], len(rows) - n
+    for start in range(0, n, writer["chunk_rows"]):
+        part = rows[start:min(start + writer["chunk_rows"], n)]
+        name = "chunk_%05d" % len(writer["chunks"])
+        data = {c: part[:, i].astype(writer["dtypes"][c]) for i, c in enumerate(writer["columns"])}
+        if writer["format"] == "npy":
+            os.makedirs(os.path.join(writer["path"], name), exist_ok=True)
+            for c, v in data.items():
+                np.save(os.path.join(writer["path"], name, c + ".npy"), v)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(pa.table(data), os.path.join(writer["path"], name + ".parquet"))
+        stats = {c: [v.min().item(), v.max().item()] for c, v in data.items()}
+        writer["chunks"].append({"name": name, "rows": len(part), "stats": stats})
+
+
+def close_writer(writer):
+    _flush(writer, last=True)
+    meta = {"format": writer["format"], "columns": writer["columns"],
+            "dtypes": {c: d.str for c, d in writer["dtypes"].items()}, "chunks": writer["chunks"],
+            "attrs": writer["attrs"]}
+    with open(os.path.join(writer["path"], "meta.json"), "w") as f:
+        json.dump(meta, f, indent=1)
+    return sum(c["rows"] for c in writer["chunks"])
+
+
+def write_results(path, results, format="npy", chunk_rows=2 ** 20):
+    # a whole DataFrame at once (e.g. the output of diacamma_model or run_sweep)
+    writer = open_writer(path, results.columns, format, chunk_rows, results.attrs)
+    write_rows(writer, results)
+    return close_writer(writer)
+
+
+def read_meta(path):
+    with open(os.path.join(path, "meta.json")) as f:
+        return json.load(f)
+
+
+def _wanted(values, stats, dtype):
+    # values: scalar or list of values, compared in the stored dtype (float32 sugar); stats: [min, max] of the chunk
+    values = np.atleast_1d(np.asarray(values, dtype=dtype))
+    return ((values >= stats[0]) & (values <= stats[1])).any()
+
+
+def _load(path, meta, chunk, columns):
+    # {column: array} of one chunk; npy columns are memory-mapped, nothing else is read
+    if meta["format"] == "npy":
+        return {c: np.load(os.path.join(path, chunk["name"], c + ".npy"), mmap_mode="r") for c in columns}
+    import pyarrow.parquet as pq
+    table = pq.read_table(os.path.join(path, chunk["name"] + ".parquet"), columns=list(columns))
+    return {c: table.column(c).to_numpy() for c in columns}
+
+
+def iter_chunks(path, columns=None, where=None):
+    # yields one DataFrame per chunk with the requested columns and the rows matching where ({column: value or list
+    # of values}); chunks whose min/max exclude the requested values are not opened
+    meta = read_meta(path)
+    columns = list(columns or meta["columns"])
+    where = where or {}
+    dtypes = {c: np.dtype(d) for c, d in meta["dtypes"].items()}
+    for chunk in meta["chunks"]:
+        if not all(_wanted(v, chunk["stats"][c], dtypes[c]) for c, v in where.items()):
+            continue
+        data = _load(path, meta, chunk, list(dict.fromkeys(columns + list(where))))
+        keep = np.ones(chunk["rows"], dtype=bool)
+        for c, v in where.items():
+            keep &= np.isin(data[c], np.asarray(v, dtype=dtypes[c]))
+        if keep.all():
+            yield pd.DataFrame({c: data[c] for c in columns}, copy=False)
+        elif keep.any():
+            yield pd.DataFrame({c: data[c][keep] for c in columns})
+
+
+def read_results(path, columns=None, where=None):
+    # everything iter_chunks yields, as one DataFrame
+    meta = read_meta(path)
+    parts = list(iter_chunks(path, columns, where))
+    if parts:
+        results = pd.concat(parts, ignore_index=True)
+    else:
+        results = pd.DataFrame({c: np.zeros(0, dtype=meta["dtypes"][c]) for c in columns or meta["columns"]})
+    results.attrs.update(meta["attrs"])
+    return results
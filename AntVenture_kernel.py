@@ -0,0 +1,311 @@
+# Compiled (Numba) kernel for AntVenture: Sims
+# The whole second of model_step (nest exit, feeding by trophallaxis / social bucket / both with the simple or complex
+# method, exploration, travel, source and return with drops) as plain loops over the ants, compiled with Numba, so
+# that small colonies do not pay Python overhead on every phase of every second. Draws come from the run's
+# np.random.Generator, as in the NumPy engines. Compiled code is cached on disk (__pycache__, or NUMBA_CACHE_DIR) and
+# reused by every later process, sweep workers included.
+# Used through diacamma_model(..., engine="compiled"), or engine="auto" when Numba is installed (the default of sweeps
+# and of the job server).
+
+import time
+
+import numpy as np
+from numba import njit
+
+from AntVenture_sims import (create_colony, model_parameters, record_results, spawn_generators, _capture, _next_stop,
+                             _resume, _save_checkpoint, _tick)
+
+# event counters returned by the kernel, as in new_profile
+FEEDINGS, DROPS, REDISTRIBUTIONS = 0, 1, 2
+
+
+@njit(cache=True)
+def _empties(fed, where, out):
+    # hungry ants inside the nest, written to out; returns how many
+    n = 0
+    for j in range(len(fed)):
+        if fed[j] < 1 and where[j] == 0:
+            out[n] = j
+            n += 1
+    return n
+
+
+@njit(cache=True)
+def _shuffle_first(a, n, k, rng):
+    # k distinct random entries among a[:n] moved to a[:k] (partial Fisher-Yates)
+    for j in range(k):
+        i = j + rng.integers(0, n - j)
+        a[i], a[j] = a[j], a[i]
+
+
+@njit(cache=True)
+def _draw_unique(a, n, m, mark, stamp, out, rng):
+    # distinct ants among m draws with replacement from a[:n], written to out; returns how many
+    u = 0
+    for _ in range(m):
+        j = a[rng.integers(0, n)]
+        if mark[j] != stamp:
+            mark[j] = stamp
+            out[u] = j
+            u += 1
+    return u
+
+
+@njit(cache=True)
+def _trophallaxis(feeders, nfeed, fed, where, qliquid, p_feed_t, fed_vol, buf, buf2, mark, counts, rng):
+    N = len(fed)
+    n_empty = _empties(fed, where, buf)
+    if n_empty == 0:
+        return False
+    p = p_feed_t * n_empty / N  # 1/feeding_time * probability to find empty ant
+    n_full = 0
+    n_part = 0
+    for j in range(nfeed):
+        i = feeders[j]
+        if rng.random() < p:
+            if qliquid[i] >= fed_vol:
+                feeders[n_full], feeders[j] = feeders[j], feeders[n_full]  # full actors first, in order
+                n_full += 1
+            else:
+                n_part += 1
+                feeders[nfeed + n_part - 1] = i  # partial actors kept after the feeders
+    if n_full > 0:
+        k = min(n_full, n_empty)
+        _shuffle_first(buf, n_empty, k, rng)
+        for j in range(k):
+            fed[buf[j]] = 1
+            qliquid[feeders[j]] -= fed_vol
+        counts[FEEDINGS] += k
+    elif n_part > 0:  # if they only have less qliquid than fed volume
+        mark[0] += 1
+        u = _draw_unique(buf, n_empty, n_part, mark[1:], mark[0], buf2, rng)
+        v = qliquid[feeders[nfeed + u - 1]] / fed_vol  # feed them with remaining stuff
+        for j in range(u):
+            fed[buf2[j]] = 1.0 if v > 0.9 else v  # more than 90% are considered full
+        for j in range(n_part):
+            qliquid[feeders[nfeed + j]] = 0  # individuals that passed liquid get to zero
+        counts[FEEDINGS] += u
+    return True
+
+
+@njit(cache=True)
+def _social_bucket(feeders, nfeed, fed, where, qliquid, fed_vol, complex_, portions, buf, buf2, mark, counts, rng):
+    N = len(fed)
+    n_empty = _empties(fed, where, buf)
+    if n_empty == 0:
+        return False
+    n_por = 0
+    for j in range(nfeed):
+        i = feeders[j]
+        n_feeds = rng.integers(1, 4)  # each forager feeds 1-3 ants at once
+        act = rng.random() < 1 / (2 / (n_empty / N) + 0.524 * n_feeds)
+        q_feed = rng.random()  # random percentatge of food to pass
+        if not act:
+            continue
+        q_feed = (1.0 if q_feed > 0.9 else q_feed) * qliquid[i]
+        qliquid[i] -= q_feed
+        for _ in range(n_feeds):
+            portions[n_por] = q_feed / n_feeds
+            n_por += 1
+    k = min(n_por, n_empty)  # cannot choose same indiv twice
+    _shuffle_first(buf, n_empty, k, rng)
+    counts[FEEDINGS] += k
+    q_over = 0.0
+    n_over = 0
+    for j in range(k):
+        a = buf[j]
+        fed[a] += portions[j] / fed_vol
+        if complex_:
+            if 0.9 < fed[a] < 1:
+                fed[a] = 1
+            elif fed[a] > 1:  # if last individuals are overfed, the excess is lost
+                q_over += fed[a] - 1
+                fed[a] = 1
+                n_over += 1
+        elif fed[a] > 0.9:  # simplified version, even if they have more than 1
+            fed[a] = 1
+    if n_over > 0:  # overfed individuals pass the excess to random receivers
+        n_recv = _empties(fed, where, buf)
+        if n_recv > 0:
+            mark[0] += 1
+            u = _draw_unique(buf, n_recv, n_over, mark[1:], mark[0], buf2, rng)
+            for j in range(u):
+                fed[buf2[j]] = min(fed[buf2[j]] + q_over / u, 1.0)  # nobody receives more than 1
+            counts[REDISTRIBUTIONS] += n_over
+    return True
+
+
+@njit(cache=True)
+def _step(where, naif, behav, timing, max_time, fed, qliquid, Nf, t_load, dist, volume, p_drop, p_out, p_nest,
+          p_source, p_feed_t, fed_vol, v_sb, v_t, complex_, state, feeders, portions, buf, buf2, mark, counts, rng):
+    # one second of one colony, phases and rules of model_step
+    # state: where / loaded class of every forager at the start of the second (0 in, 1 out, 2 source, 3 return,
+    # +4 if loaded)
+    for i in range(Nf):
+        state[i] = where[i] + (4 if where[i] == 0 and naif[i] == 1 and qliquid[i] > 0 else 0)
+    # 1.1 see if naif go out
+    for i in range(Nf):
+        if state[i] == 0 and naif[i] == 0 and rng.random() < p_out:
+            where[i] = 1
+    # 1.2. informed empty ants go out
+    for i in range(Nf):
+        if where[i] == 0 and naif[i] == 1 and qliquid[i] == 0:
+            where[i] = 1
+            timing[i] = -1
+    # 2- TROPHALLAXIS & SOCIAL BUCKET INSIDE NEST: 2.1 tropha, 2.2 SB, then both
+    for b in (1, 0, 2):
+        n = 0
+        for i in range(Nf):
+            if state[i] == 4 and behav[i] == b:
+                feeders[n] = i
+                n += 1
+        if n == 0:
+            continue
+        if b == 1:
+            done = _trophallaxis(feeders, n, fed, where, qliquid, p_feed_t, fed_vol, buf, buf2, mark, counts, rng)
+        elif b == 0:
+            done = _social_bucket(feeders, n, fed, where, qliquid, fed_vol, complex_, portions, buf, buf2, mark,
+                                  counts, rng)
+        else:
+            # if ant have more than max liquid tropha, they do social bucket, else trophallaxis
+            m = 0
+            for j in range(n):
+                if qliquid[feeders[j]] > v_t:
+                    feeders[n + m] = feeders[j]
+                    m += 1
+            if m > 0:
+                _social_bucket(feeders[n:], m, fed, where, qliquid, fed_vol, complex_, portions, buf, buf2, mark,
+                               counts, rng)
+            else:
+                _trophallaxis(feeders, n, fed, where, qliquid, p_feed_t, fed_vol, buf, buf2, mark, counts, rng)
+            done = True
+        if done:  # those with less than 10% are considered empty
+            for i in range(Nf):
+                if state[i] == 4 and behav[i] == b and qliquid[i] < 0.1:
+                    qliquid[i] = 0
+    # 3.1 Naif ants outside
+    for i in range(Nf):
+        if state[i] == 1 and naif[i] == 0:
+            if rng.random() < p_nest:
+                where[i] = 0
+            elif rng.random() < p_source:
+                where[i] = 2
+                naif[i] = 1
+                max_time[i] = t_load[behav[i]]
+                fed[i] = 1
+    # 3.2- for informed: arrive to source, or keep walking
+    for i in range(Nf):
+        if where[i] == 1 and naif[i] == 1:
+            if timing[i] == max_time[i]:
+                where[i] = 2
+                timing[i] = 0
+                max_time[i] = t_load[behav[i]]
+            else:
+                timing[i] += 1
+    # 4- at the source, 5- going back to nest (ants that were there at the start of the second)
+    for i in range(Nf):
+        s = state[i] % 4
+        if s == 2:
+            if timing[i] == max_time[i]:
+                where[i] = 3
+                timing[i] = 0
+                max_time[i] = dist[behav[i]]
+                qliquid[i] = volume[behav[i]]
+            else:
+                timing[i] += 1
+        elif s == 3:
+            if timing[i] == max_time[i]:
+                where[i] = 0
+                timing[i] = 0
+                if behav[i] != 1 and rng.random() < p_drop[behav[i]]:  # social bucket may drop the liquid
+                    qliquid[i] = 0.0 if behav[i] == 0 else qliquid[i] - v_sb
+                    counts[DROPS] += 1
+            else:
+                timing[i] += 1
+
+
+@njit(cache=True)
+def advance(where, naif, behav, timing, max_time, fed, qliquid, Nf, n_steps, t_load, dist, volume, p_drop, p_out,
+            p_nest, p_source, p_feed_t, fed_vol, v_sb, v_t, complex_, rng):
+    # n_steps seconds of every colony (row) of the table; returns the event counters
+    n_sims, N = fed.shape
+    counts = np.zeros(3, dtype=np.int64)
+    state = np.zeros(Nf, dtype=np.int8)
+    feeders = np.zeros(2 * Nf + 1, dtype=np.int64)
+    portions = np.zeros(3 * Nf + 1)
+    buf = np.zeros(N, dtype=np.int64)
+    buf2 = np.zeros(N, dtype=np.int64)
+    mark = np.zeros(N + 1, dtype=np.int64)  # mark[0]: current stamp, mark[1:]: last stamp of each ant
+    for r in range(n_sims):
+        for _ in range(n_steps):
+            _step(where[r], naif[r], behav[r], timing[r], max_time[r], fed[r], qliquid[r], Nf, t_load, dist, volume,
+                  p_drop, p_out, p_nest, p_source, p_feed_t, fed_vol, v_sb, v_t, complex_, state, feeders, portions,
+                  buf, buf2, mark, counts, rng)
+    return counts
+
+
+def _advance(dat, Nf, par, method_sb, rng, n_steps):
+    return advance(dat["where"], dat["naif"], dat["behav"], dat["timing"], dat["max_time"], dat["fed"],
+                   dat["qliquid"], Nf, n_steps, par["t_load"].astype(np.int32), par["dist"].astype(np.int32),
+                   par["volume"].astype(np.float64), par["p_drop"].astype(np.float64), float(par["p_out"]),
+                   float(par["p_nest"]), float(par["p_source"]), float(par["p_feed_t"]), float(par["fed_vol"]),
+                   float(par["v_sb"]), float(par["v_t"]), method_sb == "complex", rng)
+
+
+def warm_up():
+    # compiles the kernel (or loads it from the disk cache) in this process, e.g. before forking sweep workers
+    par, _ = model_parameters(10, sugar=0.3)
+    _advance(create_colony(4, 2, 0, 1), 2, par, "complex", np.random.default_rng(0), 1)
+
+
+def simulate_compiled(N, Nf, time_sim, par, behavior=1, method_sb="simple", n_sims=1, batched=True, seed=None,
+                      stop=None, prof=None, record_every=10, trajectory=None, checkpoint=None):
+    # same interface and output as AntVenture_sims.simulate
+    # the kernel advances the colonies of a batch one after the other, so with batched=True the random numbers each
+    # colony gets depend on how many seconds are advanced at once (record_every, trajectory); batched=False does not
+    N, time_sim, n_sims = int(N), int(time_sim), int(n_sims)
+    Nf = min(int(Nf), N)  # cannot have more foragers than ants
+    batches = [np.arange(n_sims)] if batched else np.arange(n_sims)[:, None]
+    gens = spawn_generators(seed, len(batches))
+    first, run = _resume(checkpoint, gens) if checkpoint is not None else (0, None)
+    if checkpoint is not None:
+        yield from checkpoint["blocks"]
+    for b in range(first, len(batches)):
+        colonies, rng = batches[b], gens[b]
+        dat = create_colony(N, Nf, behavior, len(colonies))
+        t, resumed = 0, -1
+        if run is not None:  # resumed in the middle of this batch, after recording second t
+            t, colonies, dat = run
+            resumed, run = t, None
+        while True:
+            if trajectory is not None and t % trajectory["every"] == 0 and t != resumed:
+                _capture(trajectory, dat, t, colonies)
+            if t % record_every == 0 and t != resumed:
+                t0 = time.perf_counter() if prof is not None else None
+                res = record_results(dat, t, colonies)
+                if prof is not None:
+                    _tick(prof, "record", t0)
+                yield res
+                if checkpoint is not None:
+                    checkpoint["blocks"].append(res)
+                if stop is not None:
+                    running = np.array([not stop(row) for row in res], dtype=bool)
+                    if not running.all():  # finished colonies leave the batch
+                        colonies = colonies[running]
+                        dat = {c: np.ascontiguousarray(v[running]) for c, v in dat.items()}
+                        if len(colonies) == 0:
+                            break
+                if checkpoint is not None:
+                    _save_checkpoint(checkpoint, gens, b, (t, colonies, dat))
+            if t >= time_sim:
+                break
+            n_steps = _next_stop(t, record_every, trajectory, time_sim) - t  # back to Python only to record results
+            t0 = time.perf_counter() if prof is not None else None
+            counts = _advance(dat, Nf, par, method_sb, rng, n_steps)
+            if prof is not None:
+                _tick(prof, "compiled kernel", t0)
+                for name, c in zip(("feedings", "drops", "redistributions"), counts):
+                    prof["events"][name] += int(c)
+            t += n_steps
+    if checkpoint is not None:
+        _save_checkpoint(checkpoint, gens, len(batches), force=True)
@@ -0,0 +1,301 @@
+# Large-colony engine for AntVenture: Sims (10^5 - 10^6 ants)
+# Colonies are simulated one at a time, with one entry per ant, and the groups the model samples from are kept as
+# index sets updated incrementally when ants move or get fed: hungry ants inside the nest (receivers), naive foragers
+# inside / outside the nest and informed foragers at home. Walking and loading are scheduled events, as in
+# AntVenture_events.py. Nothing is scanned or sorted over the whole colony, so the cost of a second grows with the
+# number of active foragers, not with N.
+# Used through diacamma_model(..., engine="large"); outputs match the step engine statistically.
+
+import heapq
+import time
+
+import numpy as np
+
+from AntVenture_sims import spawn_generators, _capture, _tick
+
+# events of the same second are processed in this order, as phases 3.2, 4 and 5 of the step engine
+ARRIVE_SOURCE, LEAVE_SOURCE, ARRIVE_NEST = 0, 1, 2
+
+
+# -------------------------------------------------------------#
+#	INDEX SETS: O(1) add / remove / uniform draw of members	#
+# -------------------------------------------------------------#
+def new_set(n, members=()):
+    # items[:size] are the members (unordered), pos[i] is the position of ant i in items or -1
+    s = {"items": np.zeros(n, dtype=np.intp), "pos": np.full(n, -1, dtype=np.intp), "size": 0}
+    set_add(s, np.asarray(members, dtype=np.intp))
+    return s
+
+
+def set_members(s):
+    return s["items"][:s["size"]]
+
+
+def set_add(s, ants):
+    # ants must not be members already
+    size = s["size"]
+    s["items"][size:size + len(ants)] = ants
+    s["pos"][ants] = np.arange(size, size + len(ants))
+    s["size"] = size + len(ants)
+
+
+def set_remove(s, ants):
+    # ants must be distinct members; the last members fill the holes left below the new size
+    if len(ants) == 0:
+        return
+    items, pos = s["items"], s["pos"]
+    size = s["size"] - len(ants)
+    gone = pos[ants]
+    holes = np.sort(gone[gone < size])
+    tail = np.arange(size, s["size"])
+    tail = tail[~np.isin(tail, gone)]
+    items[holes] = items[tail]
+    pos[items[holes]] = holes
+    pos[ants] = -1
+    s["size"] = size
+
+
+def set_sample(s, k, rng):
+    # k distinct members, in random order
+    return s["items"][rng.choice(s["size"], k, replace=False)]
+
+
+def set_sample_with_replacement(s, m, rng):
+    # unique members among m draws with replacement
+    return np.unique(s["items"][rng.integers(0, s["size"], m)])
+
+
+# ---------------------------#
+#	COLONY STATE & FEEDING	#
+# ---------------------------#
+def create_colony_large(N, Nf, behavior):
+    # ant arrays over the whole colony only for fed; everything else only exists for the foragers (first Nf ants)
+    return {"N": N, "fed": np.zeros(N), "where": np.zeros(Nf, dtype=np.int8), "naif": np.zeros(Nf, dtype=np.int8),
+            "qliquid": np.zeros(Nf), "behav": np.full(Nf, behavior, dtype=np.int8),
+            "recv": new_set(N, np.arange(N)),  # hungry (fed < 1) ants inside the nest
+            "naif_in": new_set(Nf, np.arange(Nf)), "naif_out": new_set(Nf), "home": new_set(Nf),  # informed at home
+            "fed_total": 0.0, "outside": 0, "source": 0, "informed": 0}
+
+
+def _set_fed(st, ants, values):
+    # ants: distinct receivers; keeps the fed total and the receivers set up to date
+    fed = st["fed"]
+    st["fed_total"] += float(np.sum(values - fed[ants]))
+    fed[ants] = values
+    set_remove(st["recv"], ants[fed[ants] >= 1])
+
+
+def _feed_trophallaxis_large(st, feeders, par, rng, prof=None):
+    # feeders: forager indices; returns False if nobody was hungry in the nest
+    recv, q, N = st["recv"], st["qliquid"], st["N"]
+    fed_vol = par["fed_vol"]
+    n_empty = recv["size"]
+    if n_empty == 0:
+        return False
+    act = feeders[rng.random(len(feeders)) < par["p_feed_t"] * n_empty / N]
+    full = act[q[act] >= fed_vol]
+    part = act[q[act] < fed_vol] if len(full) == 0 else act[:0]
+    k = min(len(full), n_empty)
+    if k > 0:
+        _set_fed(st, set_sample(recv, k, rng), np.ones(k))
+        q[full[:k]] -= fed_vol
+        if prof is not None:
+            prof["events"]["feedings"] += k
+    if len(part) > 0:
+        ants = set_sample_with_replacement(recv, len(part), rng)
+        value = q[part[len(ants) - 1]] / fed_vol  # feed them with remaining stuff
+        _set_fed(st, ants, np.full(len(ants), 1 if value > 0.9 else value))  # more than 90% are considered full
+        q[part] = 0  # individuals that passed liquid get to zero
+        if prof is not None:
+            prof["events"]["feedings"] += len(ants)
+    return True
+
+
+def _feed_social_bucket_large(st, feeders, par, method_sb, rng, prof=None):
+    recv, q, fed, N = st["recv"], st["qliquid"], st["fed"], st["N"]
+    n_empty = recv["size"]
+    if n_empty == 0:
+        return False
+    n_feeds = rng.integers(1, 4, len(feeders))  # each forager feeds 1-3 ants at once
+    act = rng.random(len(feeders)) < 1 / (2 / (n_empty / N) + 0.524 * n_feeds)
+    q_feed = rng.random(len(feeders))  # random percentatge of food to pass
+    q_feed = np.where(q_feed > 0.9, 1, q_feed) * q[feeders]
+    feeders, n_feeds, q_feed = feeders[act], n_feeds[act], q_feed[act]
+    q[feeders] -= q_feed
+    portions = np.repeat(q_feed / n_feeds, n_feeds)[:n_empty]  # cannot choose same indiv twice
+    ants = set_sample(recv, len(portions), rng)
+    value = fed[ants] + portions / par["fed_vol"]
+    if prof is not None:
+        prof["events"]["feedings"] += len(ants)
+    if method_sb == "complex":
+        value = np.where((value > 0.9) & (value < 1), 1, value)
+        over = value > 1
+        q_over = np.sum(value[over] - 1)
+        _set_fed(st, ants, np.minimum(value, 1))  # if last individuals are overfed, the excess is lost
+        n_over = np.count_nonzero(over)
+        if n_over and recv["size"] > 0:  # overfed individuals pass the excess to random receivers
+            more = set_sample_with_replacement(recv, n_over, rng)
+            _set_fed(st, more, np.minimum(fed[more] + q_over / len(more), 1))
+            if prof is not None:
+                prof["events"]["redistributions"] += n_over
+    else:
+        _set_fed(st, ants, np.where(value > 0.9, 1, value))  # simplified version, even if they have more than 1
+    return True
+
+
+def feed_in_nest_large(st, loaded, par, method_sb, rng, prof=None):
+    # loaded: informed foragers at home with liquid, split by behaviour as in feed_in_nest
+    q, fb = st["qliquid"], st["behav"][loaded]
+    for b, phase in ((1, "2.1 trophallaxis"), (0, "2.2 social bucket"), (2, "2.3 trophallaxis + SB")):
+        feeders = loaded[fb == b]
+        if len(feeders) == 0:
+            continue
+        t0 = time.perf_counter() if prof is not None else None
+        if b == 1:
+            done = _feed_trophallaxis_large(st, feeders, par, rng, prof)
+        elif b == 0:
+            done = _feed_social_bucket_large(st, feeders, par, method_sb, rng, prof)
+        else:
+            # more than max liquid tropha in any ant: social bucket, else the whole group does trophallaxis
+            antsb = feeders[q[feeders] > par["v_t"]]
+            if len(antsb) > 0:
+                _feed_social_bucket_large(st, antsb, par, method_sb, rng, prof)
+            else:
+                _feed_trophallaxis_large(st, feeders, par, rng, prof)
+            done = True
+        if done:  # those with less than 10% are considered empty
+            q[feeders[q[feeders] < 0.1]] = 0
+        if prof is not None:
+            _tick(prof, phase, t0)
+
+
+# ---------------#
+#	MODEL STEP	#
+# ---------------#
+def _schedule(queue, events, t, kind, ants, delay):
+    # events[t][kind]: list of ant arrays; one delay per ant
+    for d in np.unique(delay):
+        tt = t + int(d)
+        if tt not in events:
+            events[tt] = ([], [], [])
+            heapq.heappush(queue, tt)
+        events[tt][kind].append(ants[delay == d])
+
+
+def _pop(events, t, kind):
+    return np.concatenate(events[t][kind]) if events[t][kind] else None
+
+
+def model_step_large(st, par, method_sb, rng, t, queue, events, prof=None):
+    t0 = time.perf_counter() if prof is not None else None
+    fw, fn, fb, q = st["where"], st["naif"], st["behav"], st["qliquid"]
+    recv, naif_in, naif_out, home = st["recv"], st["naif_in"], st["naif_out"], st["home"]
+    t_load, dist = par["t_load"] + 1, par["dist"] + 1  # delays, indexed by behav
+    Nf_out = set_members(naif_out).copy()  # who is outside and naif, before anybody moves
+    informed = set_members(home)
+    loaded = informed[q[informed] > 0]  # foragers with liquid to share
+    leaving = informed[q[informed] == 0]
+    # 1.1 see if naif go out
+    ants = set_members(naif_in)
+    ants = ants[rng.random(len(ants)) < par["p_out"]]
+    set_remove(naif_in, ants)
+    set_add(naif_out, ants)
+    set_remove(recv, ants[recv["pos"][ants] >= 0])
+    fw[ants] = 1
+    # 1.2. informed empty ants go out, they arrive to the source after dist + 1 seconds
+    set_remove(home, leaving)
+    fw[leaving] = 1
+    st["outside"] += len(ants) + len(leaving)
+    _schedule(queue, events, t, ARRIVE_SOURCE, leaving, dist[fb[leaving]])
+    if prof is not None:
+        _tick(prof, "1 nest exit", t0)
+    # 2- TROPHALLAXIS & SOCIAL BUCKET INSIDE NEST
+    if len(loaded) > 0:
+        feed_in_nest_large(st, loaded, par, method_sb, rng, prof)
+    t0 = time.perf_counter() if prof is not None else None
+    # 3.1 Naif ants outside, those finding the source leave it loaded after t_load + 1 seconds
+    if len(Nf_out) > 0:
+        back = rng.random(len(Nf_out)) < par["p_nest"]
+        found = np.zeros(len(Nf_out), dtype=bool)
+        found[~back] = rng.random(np.count_nonzero(~back)) < par["p_source"]
+        back, found = Nf_out[back], Nf_out[found]
+        set_remove(naif_out, back)
+        set_add(naif_in, back)
+        set_add(recv, back[st["fed"][back] < 1])
+        fw[back] = 0
+        set_remove(naif_out, found)
+        fw[found] = 2
+        fn[found] = 1
+        st["fed_total"] += float(np.sum(1 - st["fed"][found]))
+        st["fed"][found] = 1
+        st["outside"] -= len(back) + len(found)
+        st["source"] += len(found)
+        st["informed"] += len(found)
+        _schedule(queue, events, t, LEAVE_SOURCE, found, t_load[fb[found]])
+    if prof is not None:
+        t0 = _tick(prof, "3.1 exploration", t0)
+    # deterministic phases: only the ants whose countdown ends now
+    if queue and queue[0] == t:
+        heapq.heappop(queue)
+        # 3.2 informed ants arrive to the source
+        ants = _pop(events, t, ARRIVE_SOURCE)
+        if ants is not None:
+            fw[ants] = 2
+            st["outside"] -= len(ants)
+            st["source"] += len(ants)
+            _schedule(queue, events, t, LEAVE_SOURCE, ants, t_load[fb[ants]])
+        # 4 full ants leave the source
+        ants = _pop(events, t, LEAVE_SOURCE)
+        if ants is not None:
+            fw[ants] = 3
+            q[ants] = par["volume"][fb[ants]]
+            st["source"] -= len(ants)
+            st["outside"] += len(ants)
+            _schedule(queue, events, t, ARRIVE_NEST, ants, dist[fb[ants]])
+        # 5 ants get back into the nest, social bucket may have dropped the liquid on the way
+        ants = _pop(events, t, ARRIVE_NEST)
+        if ants is not None:
+            fw[ants] = 0
+            set_add(home, ants)
+            st["outside"] -= len(ants)
+            ants = ants[fb[ants] != 1]
+            drop = ants[rng.random(len(ants)) < par["p_drop"][fb[ants]]]
+            q[drop[fb[drop] == 0]] = 0
+            q[drop[fb[drop] == 2]] -= par["v_sb"]  # both: only the social bucket part is lost
+            if prof is not None:
+                prof["events"]["drops"] += len(drop)
+        del events[t]
+        if prof is not None:
+            _tick(prof, "events (3.2, 4, 5)", t0)
+
+
+def record_results_large(st, t, colony):
+    # same row as record_results, from the running counters
+    inside = st["N"] - st["outside"] - st["source"]
+    return np.array([[st["fed_total"], inside, st["outside"], st["source"], st["informed"], t, colony]], dtype=float)
+
+
+def simulate_large(N, Nf, time_sim, par, behavior=1, method_sb="simple", n_sims=1, batched=True, seed=None,
+                   stop=None, prof=None, record_every=10, trajectory=None):
+    # same interface and output as AntVenture_sims.simulate, with one colony at a time (batched is ignored)
+    N, time_sim, n_sims = int(N), int(time_sim), int(n_sims)
+    Nf = min(int(Nf), N)  # cannot have more foragers than ants
+    if n_sims == 0:  # one empty block, as the batched engines
+        yield np.zeros((0, 7))
+        return
+    for colony, rng in enumerate(spawn_generators(seed, n_sims)):
+        st = create_colony_large(N, Nf, behavior)
+        queue, events = [], {}
+        for t in range(0, time_sim + 1):
+            if t > 0:
+                model_step_large(st, par, method_sb, rng, t, queue, events, prof)
+            if trajectory is not None and t % trajectory["every"] == 0:
+                _capture(trajectory, st, t, colony)
+            if t % record_every == 0:
+                t0 = time.perf_counter() if prof is not None else None
+                res = record_results_large(st, t, colony)
+                if prof is not None:
+                    _tick(prof, "record", t0)
+                yield res
+                if stop is not None and stop(res[0]):
+                    break
@@ -6,25 +6,36 @@
 
 # All parameters have been estimated using real data from Fujioka H, Marchand M, and LeBoeuf AC. "Diacamma ants adjust liquid foraging strategies in response to biophysical constraints." Proceedings of the Royal Society B 290.2000 (2023): 20230549.
 
+# Only numpy is imported at load time, so that short headless runs start fast (see antventure.py); pandas is imported
+# when a DataFrame is built
 import numpy as np
-import random
-import pandas as pd
+import importlib.util
+import os
+import pickle
 import time
 import warnings
-import matplotlib.pyplot as plt
 # ~ import PySimpleGUI as sg
-import os
-from datetime import datetime
-from scipy import stats
 # ~ import _tkinter
 # ~ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
 warnings.filterwarnings('ignore')
 
-#Define model
-def diacamma_model(N, Nf, D, time_sim, visco='NA', sugar='NA', behavior=1, terrain=0, method_sb="simple", n_sims=1):
+# Colony table: one contiguous typed array per column (one entry per ant)
+feature_list = ["task", "behav", "where", "timing", "max_time", "fed", "naif", "qliquid"]
+feature_dtypes = {"task": np.int8, "behav": np.int8, "where": np.int8, "timing": np.int32, "max_time": np.int32,
+                  "fed": np.float64, "naif": np.int8, "qliquid": np.float64}
+results_columns = ["fed", "inside", "outside", "source", "informed", "time", "colony"]
+model_version = "1"  # bump whenever a change alters the results of a seeded run (invalidates AntVenture_cache)
+# step: every ant every second; events: AntVenture_events.py; large: AntVenture_large.py; aggregate:
+# AntVenture_aggregate.py; compiled: AntVenture_kernel.py (needs Numba); auto: compiled if Numba is installed, else step
+# (single runs default to step; sweeps and the job server default to auto, which spreads the compile/load cost of the
+# kernel over many runs, but makes seeded results depend on whether Numba is installed)
+engines = ("auto", "step", "events", "large", "aggregate", "compiled")
+
+
+def model_parameters(D, visco='NA', sugar='NA', terrain=0):
     # TIME AND VOLUME
-    t_sb = 10  # time to grab social bucket 
+    t_sb = 10  # time to grab social bucket
     tt_t = 75  # time to grab trophallaxis
     v_sb = 10  # volume for social bucket ; v_t depends on tt_t and viscosity
     fed_vol = 10  # quantity to transfer in order to feed 1 ant
@@ -35,11 +46,6 @@ def diacamma_model(N, Nf, D, time_sim, visco='NA', sugar='NA', behavior=1, terra
     p_source = 0.2  # probability find food source
     p_feed_t = 0.1  # p_feed_sb not used, as it is directly computed in the model
     warning_message = "No errors found"
-    if behavior not in range(0, 3):
-        warning_message = "Behaviour is not defined."  # -- add n 2 = first tropha, and then grab, both beh at same time
-        return None, warning_message
-    Nn = N - Nf  # Number of nurses
-    foragers = np.arange(0, Nf)
     # ---------------------------#
     #	Terrain modification	#
     # ---------------------------#
@@ -54,9 +60,6 @@ def diacamma_model(N, Nf, D, time_sim, visco='NA', sugar='NA', behavior=1, terra
     if visco != 'NA':
         t_t = int(tt_t - 1.4 * visco * 1000)
         v_t = round((1 / (31.377 + 7043.306 * visco)) * t_t * 10, 1)  # multiply by 10 because the model works in 10muL
-        #
-        t_both = t_sb + t_t
-        v_both = v_sb + v_t
         if v_t < 0 or t_t < 0:
             warning_message = "Viscosity (mPA) is too high, please choose a lower value."
             return None, warning_message
@@ -64,417 +67,659 @@ def diacamma_model(N, Nf, D, time_sim, visco='NA', sugar='NA', behavior=1, terra
         visco = (0.3074 * np.exp(7.29 * sugar)) / 1000  # divided to get PA
         t_t = int(tt_t - 1.4 * visco * 1000)
         v_t = round((1 / (31.377 + 7043.306 * visco)) * t_t * 10, 1)  # multiply by 10 because the model works in 10muL
-        t_both = t_sb + t_t
-        v_both = v_sb + v_t
         if v_t < 0 or t_t < 0:
             warning_message = "Sugar concentration is too high, please choose a lower value [0-1]."
             return None, warning_message
     else:
         warning_message = "Please introduce a value for either Viscosity (mPA) or Sugar (sugar concentration in range 0-1)."
         return None, warning_message
-    # -----------------------#
-    #	START: CREATE TABLE	#
-    # -----------------------#
-    feature_list = ["task", "behav", "where", "p_temp", "timing", "max_time", "fed", "naif", "qliquid"]
-    dat = pd.DataFrame(0, index=np.arange(N), columns=feature_list)
-    dat.loc[foragers, "task"] = 0  # forager
-    dat.loc[Nf:, "task"] = 1  # nurse
-    dat.loc[:, "behav"] = behavior  # 1=tropha; 0=SB
-    results = np.zeros([int(time_sim / 10 + 1), 7])  # needs to be the same as vector below
-    results[0] = [0, N, 0, 0, 0, 0, 0]
-    vec_time = np.arange(0, time_sim + 1, 10)  # we do +1 to include 100
-    t0 = time.time()
-    fin_res = []
-    for l in np.arange(0, n_sims):
-        k = 0  # timing
-        results[:] = 0
-        results[:, 6] = int(l)
-        dat.iloc[:, 2:] = 0
-        for t in np.arange(1, time_sim + 1):
-            # SELECT NAIF INDIVIDUALS DEPENDING ON WHERE
-            Nf_in = np.where(dat.loc[foragers, ["where", "naif"]].sum(axis=1) == 0)[0]  # who is in nest and naif
-            Nf_out = np.where((dat.loc[foragers, "where"] == 1) & (dat.loc[foragers, "naif"] == 0))[
-                0]  # who is outside and naif
-            Nf_source = np.where(dat.loc[foragers, "where"] == 2)[0]  # who is at the source
-            Nf_ret = np.where(dat.loc[foragers, "where"] == 3)[0]  # who is going back to nest
-            Nf_tropha = np.where(
-                (dat.loc[foragers, "where"] == 0) & (dat.loc[foragers, "naif"] == 1) & (dat.loc[foragers, "behav"] == 1) & (
-                        dat.loc[foragers, "qliquid"] > 0))[0]  # find foragers with liquid to share troph
-            Nf_sb = np.where(
-                (dat.loc[foragers, "where"] == 0) & (dat.loc[foragers, "naif"] == 1) & (dat.loc[foragers, "behav"] == 0) & (
-                        dat.loc[foragers, "qliquid"] > 0))[0]  # find foragers with liquid to share SB
-            Nf_trsb = np.where(
-                (dat.loc[foragers, "where"] == 0) & (dat.loc[foragers, "naif"] == 1) & (dat.loc[foragers, "behav"] == 2) & (
-                        dat.loc[foragers, "qliquid"] > 0))[0]  # find foragers with liquid to share tropha + SB
-            # -------------------------#
-            # 1- ANTS INSIDE NEST phase#
-            # -------------------------#
-            # 1.1 see if naif go out
-            if len(Nf_in) > 0:
-                dat.loc[Nf_in, "p_temp"] = np.random.random(len(Nf_in)) - p_out  # random prob for all naives inside nest
-                dat.loc[Nf_in, "where"] = np.where((dat.loc[Nf_in, "p_temp"] < 0), 1,
-                                                   dat.loc[Nf_in, "where"])  # those that are negative, go outside
-            # 1.2. informed empty ants go out
-            temp = np.where(
-                (dat.loc[foragers, "where"] == 0) & (dat.loc[foragers, "naif"] == 1) & (dat.loc[foragers, "qliquid"] == 0))[
-                0]  # who is in nest, Informed (naif=1) & empty --> goes out
-            for i in temp:
-                if dat.loc[i, "behav"] == 1:  # if tropha
-                    dat.loc[i, ["where", "timing"]] = [1,
-                                                       -1]  # we put -1 because in the phase "outside", they will get +1 timing, so they will get at zero and the end of timestep
-                elif dat.loc[i, "behav"] == 0:  # SB
-                    dat.loc[i, ["where", "timing"]] = [1, -1]  # max time already in dist_sb/t mode
-                else:  # both
-                    dat.loc[i, ["where", "timing"]] = [1, -1]  # max time already in dist_sb/t mode]
-            dat.loc[:, "p_temp"] = 0  # reboot proba to 0
-            # -------------------------------------------#
-            # 2- TROPHALLAXIS & SOCIAL BUCKET INSIDE NEST#
-            # -------------------------------------------#
-            ######################
-            # 2.1 - Trophallaxis  #
-            ######################
-            if len(Nf_tropha) > 0:
-                Nempty = np.where((dat.loc[:, "fed"] < 1) & (dat.loc[:, "where"] == 0))[0]
-                if len(Nempty) > 0:  # if empty ants in nest
-                    dat.loc[Nf_tropha, "p_temp"] = np.random.random(len(Nf_tropha)) - p_feed_t * len(
-                        Nempty) / N  # 1/feeding_time * probability to find empty ant; could be N/(area*something else). Makes up for time passing food --------------- check max_capacity
-                    if len(np.where((dat.loc[Nf_tropha, "p_temp"] < 0) & (dat.loc[Nf_tropha, "qliquid"] >= fed_vol))[
-                               0]) > 0:
-                        temp = random.sample(sorted(Nempty), len(
-                            (np.where((dat.loc[Nf_tropha, "p_temp"] < 0) & (dat.loc[Nf_tropha, "qliquid"] >= fed_vol)))[
-                                0]))  # we choose randomly which individual is fed with fed_vol
-                        dat.loc[temp, "fed"] = 1  # those are fed
-                        temp = np.where((dat.loc[Nf_tropha, "p_temp"] < 0) & (dat.loc[Nf_tropha, "qliquid"] >= fed_vol))
-                        dat.loc[Nf_tropha[temp], "p_temp"] = 0
-                        dat.loc[Nf_tropha[temp], "qliquid"] = dat.loc[Nf_tropha[temp], "qliquid"] - fed_vol
-                    elif len(np.where((dat.loc[Nf_tropha, "p_temp"] < 0) & (dat.loc[Nf_tropha, "qliquid"] < fed_vol))[
-                                 0]) > 0:  # if they have less qliquid than fed volume
-                        temp = np.unique(np.random.choice(sorted(Nempty), len(
-                            (np.where((dat.loc[Nf_tropha, "p_temp"] < 0) & (dat.loc[Nf_tropha, "qliquid"] < fed_vol)))[
-                                0])))  # select how many indivs to feed
-                        q_feed = dat.loc[Nf_tropha[(dat.loc[Nf_tropha, "p_temp"] < 0) & (
-                                dat.loc[Nf_tropha, "qliquid"] < fed_vol)], "qliquid"].values[
-                            len(temp) - 1]  # feed them with remaining stuff
-                        dat.loc[temp, "fed"] = q_feed / fed_vol  # feed them with remaining stuff
-                        dat.loc[temp, "fed"] = np.where((dat.loc[temp, "fed"] > 0.9), 1, dat.loc[
-                            temp, "fed"])  # those fed more than 90% are considered full, --- simplified version, even if they have more than 1
-                        dat.loc[Nf_tropha, "qliquid"] = np.where(
-                            (dat.loc[Nf_tropha, "p_temp"] < 0) & (dat.loc[Nf_tropha, "qliquid"] < fed_vol), 0,
-                            dat.loc[Nf_tropha, "qliquid"])  # individuals that passed liquid get to zero
-                    dat.loc[:, "p_temp"] = 0  # reboot proba to 0
-                    temp = 0
-                    dat.loc[Nf_tropha, "qliquid"] = np.where((dat.loc[Nf_tropha, "qliquid"] < 0.1), 0, dat.loc[
-                        Nf_tropha, "qliquid"])  # those with less than 10% are considered empty, just in case of miss-adjustment
-            ############
-            # 2.2 - SB  #
-            ############
-            if len(Nf_sb) > 0:
-                Nempty = np.where((dat.loc[:, "fed"] < 1) & (dat.loc[:, "where"] == 0))[0]
-                if (len(Nempty) > 0):  # if empty ants in nest
-                    n_feeds = np.random.choice(range(1, 4), len(Nf_sb), replace=True)
-                    dat.loc[Nf_sb, "p_temp"] = np.random.random(len(Nf_sb)) - 1 / (2 / (
-                            len(Nempty) / N) + 0.524 * n_feeds)  # We multiply prob by 1-3 randomly, but could fix this to X -- can be rewriten as len(Nempty)/(0.524*len(Nempty)*N + 2*n_feeds)
-                    q_feed = np.random.random(len(Nf_sb))  # random percentatge of food to pass
-                    q_feed = np.where(q_feed > 0.9, 1, q_feed)  # if they pass more than 90%, let's say they pass everything
-                    q_feed *= dat.loc[Nf_sb, "qliquid"]  # determine quantity in liquid
-                    dat.loc[Nf_sb, "qliquid"] = np.where((dat.loc[Nf_sb, "p_temp"] < 0), dat.loc[Nf_sb, "qliquid"] - q_feed,
-                                                         dat.loc[Nf_sb, "qliquid"])  # individuals pass liquid
-                    temp = np.sum(n_feeds[np.where(dat.loc[Nf_sb, "p_temp"] < 0)[0]])  # how many individuals are fed
-                    if temp <= len(Nempty):
-                        temp = np.random.choice(sorted(Nempty), temp,
-                                                replace=False)  # choose them randomly among the pool of empty; cannot choose same indiv twice
-                        dat.loc[temp, "fed"] += (np.repeat(
-                            q_feed.iloc[np.where(dat.loc[Nf_sb, "p_temp"] < 0)[0]].values / n_feeds[
-                                np.where(dat.loc[Nf_sb, "p_temp"] < 0)[0]], n_feeds[np.where(dat.loc[Nf_sb, "p_temp"] < 0)[
-                                0]])) / fed_vol  # those are fed, we increase fed cell, according to the amount passed and divided by the total numbers of individuals engaged with each forager
-                    else:
-                        temp = Nempty  # choose them randomly among the pool of empty; cannot choose same indiv twice
-                        dat.loc[temp, "fed"] += (np.repeat(
-                            q_feed.iloc[np.where(dat.loc[Nf_sb, "p_temp"] < 0)[0]].values / n_feeds[
-                                np.where(dat.loc[Nf_sb, "p_temp"] < 0)[0]],
-                            n_feeds[np.where(dat.loc[Nf_sb, "p_temp"] < 0)[0]]))[0:len(
-                            Nempty)] / fed_vol  # those are fed, we increase fed cell, according to the amount passed and divided by the total numbers of individuals engaged with each forager
-                    ###################################
-                    #	METHOD SB: COMPLEX VS SIMPLE  #
-                    ###################################
-                    if method_sb == "complex":
-                        dat.loc[temp, "fed"] = np.where((dat.loc[temp, "fed"] > 0.9) & (dat.loc[temp, "fed"] < 1), 1,
-                                                        dat.loc[
-                                                            temp, "fed"])  # those fed more than 90%, but less than 1 are considered full
-                        dat.loc[Nf_sb, "qliquid"] = np.where((dat.loc[Nf_sb, "qliquid"] < 0.1), 0, dat.loc[
-                            Nf_sb, "qliquid"])  # those with less than 10% are considered empty
-                        if (len(np.where(dat.loc[:, "fed"] > 1)[0]) > 0) & (len(
-                                np.where((dat.loc[:, "fed"] < 1) & (dat.loc[:, "where"] == 0))[
-                                    0]) > 0):  # if some individuals are overfed and receivers available
-                            temp = np.where(dat.loc[:, "fed"] > 1)[0]
-                            q_feed = dat.loc[temp, "fed"] - 1
-                            dat.loc[temp, "fed"] = 1
-                            temp = np.random.choice(
-                                sorted(np.where((dat.loc[:, "fed"] < 1) & (dat.loc[:, "where"] == 0))[0]), len(q_feed),
-                                replace=True)  # select a random ant to pass food
-                            dat.loc[temp, "fed"] += np.sum(q_feed) / len(np.unique(temp))
-                            dat.loc[temp, "fed"] = np.where(dat.loc[temp, "fed"] > 1, 1, dat.loc[
-                                temp, "fed"])  # if some of them receive more than 1 of food, we set them to 1
-                        elif (len(np.where(dat.loc[:, "fed"] > 1)[0]) > 0) & (len(
-                                np.where((dat.loc[:, "fed"] < 1) & (dat.loc[:, "where"] == 0))[
-                                    0]) == 0):  # if last individuals are overfed
-                            dat.loc[dat.loc[:, "fed"] > 1, "fed"] = 1
-                    elif method_sb == "simple":
-                        dat.loc[temp, "fed"] = np.where((dat.loc[temp, "fed"] > 0.9), 1, dat.loc[
-                            temp, "fed"])  # those fed more than 90% are considered full, --- simplified version, even if they have more than 1
-                    else:
-                        warning_message = "please choose a method_sb: 'complex' or 'simple', default option is 'simple'"
-                        return None, warning_message
-                    dat.loc[Nf_sb, "qliquid"] = np.where((dat.loc[Nf_sb, "qliquid"] < 0.1), 0, dat.loc[
-                        Nf_sb, "qliquid"])  # those with less than 10% are considered empty
-                    dat.loc[:, "p_temp"] = 0  # reboot proba to 0
-                    temp = 0
-            ##################################
-            #	Trophallaxis + SB together	 #
-            ##################################
-            if len(Nf_trsb) > 0:
-                # comment: if ant have more than max liquid tropha, they do social bucket
-                #			elif liquid is EQUAL or less than max liquid tropha, they do trophallaxis action.
-                antsb = np.where(dat.loc[Nf_trsb, "qliquid"] > v_t)
-                antt = np.where(dat.loc[Nf_trsb, "qliquid"] <= v_t)
-                if len(antsb[0]) > 0:
-                    Nempty = np.where((dat.loc[:, "fed"] < 1) & (dat.loc[:, "where"] == 0))[0]
-                    if len(Nempty) > 0:  # if empty ants in nest
-                        n_feeds = np.random.choice(range(1, 4), len(Nf_trsb[antsb]), replace=True)
-                        dat.loc[Nf_trsb[antsb], "p_temp"] = np.random.random(len(Nf_trsb[antsb])) - 1 / (2 / (
-                                len(Nempty) / N) + 0.524 * n_feeds)  # We multiply prob by 1-3 randomly, but could fix this to X -- can be rewriten as len(Nempty)/(0.524*len(Nempty)*N + 2*n_feeds)
-                        q_feed = np.random.random(len(Nf_trsb[antsb]))  # random percentatge of food to pass
-                        q_feed = np.where(q_feed > 0.9, 1,
-                                          q_feed)  # if they pass more than 90%, let's say they pass everything
-                        q_feed *= dat.loc[Nf_trsb[antsb], "qliquid"]  # determine quantity in liquid
-                        dat.loc[Nf_trsb[antsb], "qliquid"] = np.where((dat.loc[Nf_trsb[antsb], "p_temp"] < 0),
-                                                                      dat.loc[Nf_trsb[antsb], "qliquid"] - q_feed, dat.loc[
-                                                                          Nf_trsb[
-                                                                              antsb], "qliquid"])  # individuals pass liquid
-                        temp = np.sum(
-                            n_feeds[np.where(dat.loc[Nf_trsb[antsb], "p_temp"] < 0)[0]])  # how many individuals are fed
-                        if temp <= len(Nempty):
-                            temp = np.random.choice(sorted(Nempty), temp,
-                                                    replace=False)  # choose them randomly among the pool of empty; cannot choose same indiv twice
-                            dat.loc[temp, "fed"] += (np.repeat(
-                                q_feed.iloc[np.where(dat.loc[Nf_trsb[antsb], "p_temp"] < 0)[0]].values / n_feeds[
-                                    np.where(dat.loc[Nf_trsb[antsb], "p_temp"] < 0)[0]], n_feeds[
-                                    np.where(dat.loc[Nf_trsb[antsb], "p_temp"] < 0)[
-                                        0]])) / fed_vol  # those are fed, we increase fed cell, according to the amount passed and divided by the total numbers of individuals engaged with each forager
-                        else:
-                            temp = Nempty  # choose them randomly among the pool of empty; cannot choose same indiv twice
-                            dat.loc[temp, "fed"] += (np.repeat(
-                                q_feed.iloc[np.where(dat.loc[Nf_trsb[antsb], "p_temp"] < 0)[0]].values / n_feeds[
-                                    np.where(dat.loc[Nf_trsb[antsb], "p_temp"] < 0)[0]],
-                                n_feeds[np.where(dat.loc[Nf_trsb[antsb], "p_temp"] < 0)[0]]))[0:len(
-                                Nempty)] / fed_vol  # those are fed, we increase fed cell, according to the amount passed and divided by the total numbers of individuals engaged with each forager
-                        ###################################
-                        #	METHOD SB: COMPLEX VS SIMPLE  #
-                        ###################################
-                        if method_sb == "complex":
-                            dat.loc[temp, "fed"] = np.where((dat.loc[temp, "fed"] > 0.9) & (dat.loc[temp, "fed"] < 1), 1,
-                                                            dat.loc[
-                                                                temp, "fed"])  # those fed more than 90%, but less than 1 are considered full
-                            if (len(np.where(dat.loc[:, "fed"] > 1)[0]) > 0) & (len(
-                                    np.where((dat.loc[:, "fed"] < 1) & (dat.loc[:, "where"] == 0))[
-                                        0]) > 0):  # if some individuals are overfed and receivers available
-                                temp = np.where(dat.loc[:, "fed"] > 1)[0]
-                                q_feed = dat.loc[temp, "fed"] - 1
-                                dat.loc[temp, "fed"] = 1
-                                temp = np.random.choice(
-                                    sorted(np.where((dat.loc[:, "fed"] < 1) & (dat.loc[:, "where"] == 0))[0]), len(q_feed),
-                                    replace=True)  # select a random ant to pass food
-                                dat.loc[temp, "fed"] += np.sum(q_feed) / len(np.unique(temp))
-                                dat.loc[temp, "fed"] = np.where(dat.loc[temp, "fed"] > 1, 1, dat.loc[
-                                    temp, "fed"])  # if some of them receive more than 1 of food, we set them to 1
-                            elif (len(np.where(dat.loc[:, "fed"] > 1)[0]) > 0) & (len(
-                                    np.where((dat.loc[:, "fed"] < 1) & (dat.loc[:, "where"] == 0))[
-                                        0]) == 0):  # if last individuals are overfed
-                                dat.loc[dat.loc[:, "fed"] > 1, "fed"] = 1
-                        elif method_sb == "simple":
-                            dat.loc[temp, "fed"] = np.where((dat.loc[temp, "fed"] > 0.9), 1, dat.loc[
-                                temp, "fed"])  # those fed more than 90% are considered full, --- simplified version, even if they have more than 1
-                        else:
-                            warning_message = "please choose a method_sb: 'complex' or 'simple', default option is 'simple'"
-                            return None, warning_message
-                        dat.loc[:, "p_temp"] = 0  # reboot proba to 0
-                        temp = 0
-                        antsb = 0
-                    Nempty = np.where((dat.loc[:, "fed"] < 1) & (dat.loc[:, "where"] == 0))[0]
-                elif len(antt[0]) > 0:
-                    Nempty = np.where((dat.loc[:, "fed"] < 1) & (dat.loc[:, "where"] == 0))[0]
-                    if len(Nempty) > 0:  # if empty ants in nest
-                        dat.loc[Nf_trsb[antt], "p_temp"] = np.random.random(len(Nf_trsb[antt])) - p_feed_t * len(
-                            Nempty) / N  # 1/feeding_time * probability to find empty ant; could be N/(area*something else). Makes up for time passing food --------------- check max_capacity
-                        if len(np.where(
-                                (dat.loc[Nf_trsb[antt], "p_temp"] < 0) & (dat.loc[Nf_trsb[antt], "qliquid"] >= fed_vol))[
-                                   0]) > 0:  # if they have qliquid higher than fed volume
-                            temp = random.sample(sorted(Nempty), len((np.where(
-                                (dat.loc[Nf_trsb[antt], "p_temp"] < 0) & (dat.loc[Nf_trsb[antt], "qliquid"] >= fed_vol)))[
-                                                                         0]))  # we choose randomly which individual is fed with fed_vol
-                            dat.loc[temp, "fed"] = 1  # those are fed
-                            temp = np.where(
-                                (dat.loc[Nf_trsb[antt], "p_temp"] < 0) & (dat.loc[Nf_trsb[antt], "qliquid"] >= fed_vol))
-                            dat.loc[Nf_trsb[antt][temp], "p_temp"] = 0
-                            dat.loc[Nf_trsb[antt][temp], "qliquid"] = dat.loc[Nf_trsb[antt][temp], "qliquid"] - fed_vol
-                            Nempty = np.where((dat.loc[:, "fed"] < 1) & (dat.loc[:, "where"] == 0))[0]
-                        elif len(np.where(
-                                (dat.loc[Nf_trsb[antt], "p_temp"] < 0) & (dat.loc[Nf_trsb[antt], "qliquid"] < fed_vol))[
-                                     0]) > 0:  # if they have less qliquid than fed volume
-                            temp = np.unique(np.random.choice(sorted(Nempty), len((np.where(
-                                (dat.loc[Nf_trsb[antt], "p_temp"] < 0) & (dat.loc[Nf_trsb[antt], "qliquid"] < fed_vol)))[
-                                                                                      0])))  # select how many indivs to feed
-                            q_feed = dat.loc[Nf_trsb[antt][(dat.loc[Nf_trsb[antt], "p_temp"] < 0) & (
-                                    dat.loc[Nf_trsb[antt], "qliquid"] < fed_vol)], "qliquid"].values[
-                                len(temp) - 1]  # feed them with remaining stuff
-                            dat.loc[temp, "fed"] = q_feed / fed_vol  # feed them with remaining stuff
-                            dat.loc[temp, "fed"] = np.where((dat.loc[temp, "fed"] > 0.9), 1, dat.loc[
-                                temp, "fed"])  # those fed more than 90% are considered full, --- simplified version, even if they have more than 1
-                            dat.loc[Nf_trsb[antt], "qliquid"] = np.where(
-                                (dat.loc[Nf_trsb[antt], "p_temp"] < 0) & (dat.loc[Nf_trsb[antt], "qliquid"] < fed_vol), 0,
-                                dat.loc[Nf_trsb[antt], "qliquid"])  # individuals that passed liquid get to zero
-                        dat.loc[:, "p_temp"] = 0  # reboot proba to 0
-                        temp = 0
-                        antt = 0
-                dat.loc[Nf_trsb, "qliquid"] = np.where((dat.loc[Nf_trsb, "qliquid"] < 0.1), 0, dat.loc[
-                    Nf_trsb, "qliquid"])  # those with less than 10% are considered empty, just in case of miss-adjustment
-            # ---------------------------------------------------------#
-            # 3- ANTS OUTSIDE phase, exploring arena or going to source#
-            # ---------------------------------------------------------#
-            # 3.1 Naif ants outside
-            if len(Nf_out) > 0:
-                # go back to nest?
-                dat.loc[Nf_out, "p_temp"] = np.random.random(len(Nf_out)) - p_nest  # probability to go back to nest
-                dat.loc[Nf_out, "where"] = np.where((dat.loc[Nf_out, "p_temp"] < 0), 0, 1)  # those that go back to nest
-                # find source?
-                temp = np.where(dat.loc[Nf_out, "p_temp"] > 0)[0]  # those that are still outside
-                Nf_out = Nf_out[temp]
-                dat.loc[Nf_out, "p_temp"] = np.random.random(len(Nf_out)) - p_source  # probability to find source
-                temp = np.where(dat.loc[Nf_out, "p_temp"] < 0)[0]  # those that get to source
-                for i in Nf_out[temp]:
-                    if dat.loc[i, "behav"] == 1:
-                        dat.loc[i, ["where", "naif", "max_time", "fed"]] = [2, 1, t_t, 1]
-                    elif dat.loc[i, "behav"] == 0:
-                        dat.loc[i, ["where", "naif", "max_time", "fed"]] = [2, 1, t_sb, 1]
-                    else:
-                        dat.loc[i, ["where", "naif", "max_time", "fed"]] = [2, 1, t_both, 1]
-                dat.loc[:, "p_temp"] = 0
-                temp = 0
-            # 3.2- for informed
-            # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-            # ------- COMMENT: this can be simplified into probability by nº of informed ants foraging, or 1/temps_to_grab or 1/temps distance ----- make another version of the model with proba an compare
-            # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-            temp = np.where(
-                (dat.loc[foragers, "timing"] == dat.loc[foragers, "max_time"]) & (dat.loc[foragers, "where"] == 1) & (
-                        dat.loc[foragers, "naif"] == 1))[0]  # select those that ARRIVE to source
-            for i in temp:
-                if dat.loc[i, "behav"] == 1:
-                    dat.loc[i, ["where", "timing", "max_time"]] = [2, 0,
-                                                                   t_t]  # get into source (2), reboot timing and change max_time for trophallaxis or social bucket, they become fed too
-                elif dat.loc[i, "behav"] == 0:
-                    dat.loc[i, ["where", "timing", "max_time"]] = [2, 0, t_sb]
-                else:
-                    dat.loc[i, ["where", "timing", "max_time"]] = [2, 0, t_both]
-            dat.loc[foragers, "timing"] = np.where((dat.loc[foragers, "where"] == 1) & (dat.loc[foragers, "naif"] == 1),
-                                                   dat.loc[foragers, "timing"] + 1, dat.loc[
-                                                       foragers, "timing"])  # who is outside and Informed, increase timing by 1
-            dat.loc[:, "p_temp"] = 0  # reboot proba to 0
-            temp = 0
-            # ---------------------------#
-            # 4- ANTS AT THE SOURCE phase#
-            # ---------------------------#
-            if len(Nf_source) > 0:
-                temp = np.where((dat.loc[Nf_source, "timing"] == dat.loc[Nf_source, "max_time"]))[
-                    0]  # select those that are full --> do this with probability 1/temps_to_grab or 1/temps distance
-                for i in Nf_source[temp]:
-                    if dat.loc[i, "behav"] == 1:
-                        dat.loc[i, ["where", "timing", "max_time", "qliquid"]] = [3, 0, dist_t,
-                                                                                  v_t]  # return (3), reboot timing, max_time & qliquid for trophallaxis or social bucket, use 0 here, no +1 later
-                    elif dat.loc[i, "behav"] == 0:
-                        dat.loc[i, ["where", "timing", "max_time", "qliquid"]] = [3, 0, dist_sb, v_sb]
-                    else:
-                        dat.loc[i, ["where", "timing", "max_time", "qliquid"]] = [3, 0, dist_both, v_both]
-                dat.loc[np.delete(Nf_source, temp), "timing"] += 1  # who is at source, increase timing by 1
-                temp = 0
-            # --------------------------------#
-            # 5- ANTS GOING BACK TO NEST phase#
-            # --------------------------------#
-            if len(Nf_ret) > 0:
-                temp = np.where((dat.loc[Nf_ret, "timing"] == dat.loc[Nf_ret, "max_time"]))[
-                    0]  # select those that get back into the nest --> do this with probability 1/temps_to_grab or 1/temps distance
-                for i in Nf_ret[temp]:
-                    if dat.loc[i, "behav"] == 1:
-                        dat.loc[i, ["where", "timing"]] = [0,
-                                                           0]  # return (3), reboot timing, max_time & qliquid for trophallaxis or social bucket, use -1 bc we +1 later
-                    elif dat.loc[i, "behav"] == 0:
-                        dat.loc[i, ["where", "timing"]] = [0,
-                                                           0]  # if we don't change max-time, is one change less when they go out again *** remove this change from top, except if we add randomnes... can be also personality like, each ant always same time, or random choice everytime
-                        if random.random() < p_drop_sb * dist_sb:
-                            dat.loc[i, "qliquid"] = 0
-                        else:
-                            pass
-                    else:
-                        dat.loc[i, ["where", "timing"]] = [0,
-                                                           0]  # if we don't change max-time, is one change less when they go out again *** remove this change from top, except if we add randomnes... can be also personality like, each ant always same time, or random choice everytime
-                        if random.random() < p_drop_sb * dist_both:
-                            dat.loc[i, "qliquid"] -= v_sb
-                        else:
-                            pass
-                dat.loc[np.delete(Nf_ret, temp), "timing"] += 1  # who is returning, increase timing by 1
-                temp = 0
-            if t in vec_time:
-                k += 1
-                results[k, 0] = np.sum(dat["fed"])  # number of fed ants
-                results[k, 1] = len(np.where(dat.loc[:, "where"] == 0)[0])  # number of ants inside
-                results[k, 2] = len(np.where((dat.loc[:, "where"] == 1) | (dat.loc[:, "where"] == 3))[0])  # ants outside
-                results[k, 3] = len(np.where(dat.loc[:, "where"] == 2)[0])  # ants at source
-                results[k, 4] = len(np.where(dat.loc[:, "naif"] == 1)[0])  # ants that visited the source
-                results[k, 5] = t  # timestep
-        res = pd.DataFrame(results, columns=["fed", "inside", "outside", "source", "informed", "time", "colony"])
-        fin_res.append(res.copy())
-    fin_res = pd.concat(fin_res)
-    print(time.time() - t0)
+    t_both = t_sb + t_t
+    v_both = v_sb + v_t
+    par = {"t_sb": t_sb, "t_t": t_t, "t_both": t_both, "v_sb": v_sb, "v_t": v_t, "v_both": v_both, "fed_vol": fed_vol,
+           "p_out": p_out, "p_nest": p_nest, "p_source": p_source, "p_feed_t": p_feed_t, "p_drop_sb": p_drop_sb,
+           "dist_t": dist_t, "dist_sb": dist_sb, "dist_both": dist_both, "visco": visco}
+    # lookup tables indexed by behav (0=SB, 1=tropha, 2=both): loading time, travel time, volume and drop probability
+    par["t_load"] = np.array([t_sb, t_t, t_both])
+    par["dist"] = np.array([dist_sb, dist_t, dist_both])
+    par["volume"] = np.array([v_sb, v_t, v_both])
+    par["p_drop"] = np.array([p_drop_sb * dist_sb, 0, p_drop_sb * dist_both])  # trophallaxis never drops
+    return par, warning_message
+
+
+def spawn_generators(seed, n):
+    # n independent random streams (SeedSequence children) from a seed; a Generator is shared as it is
+    if isinstance(seed, np.random.Generator):
+        return [seed] * n
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [np.random.default_rng(s) for s in seed.spawn(n)]
+
+
+def create_colony(N, Nf, behavior, n_sims=1):
+    # one row per replicate colony, one column per ant
+    dat = {c: np.zeros((n_sims, N), dtype=feature_dtypes[c]) for c in feature_list}
+    dat["task"][:, Nf:] = 1  # 0=forager; 1=nurse
+    dat["behav"][:] = behavior  # 1=tropha; 0=SB; 2=both
+    return dat
+
+
+def _draw(mask, p, rng):
+    # Bernoulli draw for the ants selected in mask; p is a scalar or one value per selected ant
+    hit = mask.copy()
+    hit[mask] = rng.random(np.count_nonzero(mask)) < p
+    return hit
+
+
+def _rank_in_row(rows, n_rows):
+    # position of each (row-sorted) entry inside its own row
+    counts = np.bincount(rows, minlength=n_rows)
+    return np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+def _sample_without_replacement(mask, k, rng):
+    # choose k[r] distinct ants among mask[r] in every colony r; returns (rows, cols) grouped by row, random order
+    n_sims = mask.shape[0]
+    k = np.minimum(k, np.count_nonzero(mask, axis=1))
+    kmax = int(k.max()) if n_sims > 0 else 0
+    if kmax == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    keys = rng.random(mask.shape)
+    keys[~mask] = 2  # never chosen before an eligible ant
+    cols = np.argpartition(keys, kmax - 1, axis=1)[:, :kmax]
+    cols = np.take_along_axis(cols, np.argsort(np.take_along_axis(keys, cols, axis=1), axis=1), axis=1)
+    rows, pos = np.nonzero(np.arange(kmax) < k[:, None])
+    return rows, cols[rows, pos]
+
+
+def _sample_with_replacement(mask, m, rng):
+    # draw m[r] ants (with replacement) among mask[r] in every colony r; returns the unique (rows, cols) drawn
+    n_sims, N = mask.shape
+    rows = np.repeat(np.arange(n_sims), m)
+    if len(rows) == 0:
+        return rows, rows
+    n = np.count_nonzero(mask, axis=1)
+    rank = (rng.random(len(rows)) * n[rows]).astype(np.intp)
+    # cumulative count of eligible ants, offset per row so that the whole table is sorted
+    cs = (np.cumsum(mask, axis=1) + np.arange(n_sims)[:, None] * (N + 1)).ravel()
+    idx = np.unique(np.searchsorted(cs, rank + rows * (N + 1), side="right"))  # flat (row, col) positions
+    return idx // N, idx % N
+
+
+def new_profile():
+    # cumulative time (s) and number of calls per phase, and counts of model events
+    return {"time": {}, "calls": {}, "events": {"feedings": 0, "drops": 0, "redistributions": 0}}
+
+
+def _tick(prof, phase, t0):
+    # adds the time elapsed since t0 to `phase`; returns the current time, start of the next phase
+    t1 = time.perf_counter()
+    prof["time"][phase] = prof["time"].get(phase, 0) + t1 - t0
+    prof["calls"][phase] = prof["calls"].get(phase, 0) + 1
+    return t1
+
+
+def profile_table(prof):
+    # phases sorted by cumulative time, with their share of the total
+    import pandas as pd
+    table = pd.DataFrame({"time": prof["time"], "calls": prof["calls"]}).drop("total", errors="ignore")
+    table["share"] = table["time"] / table["time"].sum()
+    return table.sort_values("time", ascending=False)
+
+
+# ---------------------------#
+#	PER-ANT TRAJECTORIES	#
+# ---------------------------#
+trajectory_dtypes = {"where": np.int8, "naif": np.int8, "fed": np.float32, "qliquid": np.float32}
+
+
+def new_trajectory(N, time_sim, n_sims=1, every=1, features=("where", "fed", "qliquid", "naif"), path=None):
+    # preallocated per-ant buffers, filled by diacamma_model(..., trajectory=traj): one (frames, n_sims, N) array per
+    # feature, frame i being second i * every; traj["recorded"][i, colony] tells which frames a colony reached
+    # path: directory of memory-mapped .npy files (one per feature, plus recorded.npy) instead of memory, so that long
+    # trajectories of large colonies are written to disk as they are captured; read them back with
+    # np.load(os.path.join(path, "fed.npy"), mmap_mode="r")
+    unknown = [f for f in features if f not in trajectory_dtypes]
+    if unknown:
+        raise ValueError("unknown trajectory feature(s): " + ", ".join(unknown))
+    every = int(every)
+    frames = int(time_sim) // every + 1
+    shape = (frames, int(n_sims), int(N))
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+
+    def buffer(name, dtype, shape):
+        if path is None:
+            return np.zeros(shape, dtype=dtype)
+        return np.lib.format.open_memmap(os.path.join(path, name + ".npy"), mode="w+", dtype=dtype, shape=shape)
+
+    traj = {"every": every, "features": tuple(features), "time": np.arange(frames) * every,
+            "recorded": buffer("recorded", np.bool_, shape[:2])}
+    for f in features:
+        traj[f] = buffer(f, trajectory_dtypes[f], shape)
+    return traj
+
+
+def _capture(traj, dat, t, colonies):
+    # state of the running colonies at second t (a multiple of traj["every"]); engines that only keep the foragers'
+    # state leave the other ants at 0 (inside, not informed, no liquid)
+    frame = t // traj["every"]
+    for f in traj["features"]:
+        v = dat[f]
+        traj[f][frame, colonies, :v.shape[-1]] = v
+    traj["recorded"][frame, colonies] = True
+
+
+def _next_stop(t, record_every, trajectory, time_sim):
+    # next second at which an engine has to come back to record results or capture a trajectory frame
+    t_next = (t // record_every + 1) * record_every
+    if trajectory is not None:
+        t_next = min(t_next, (t // trajectory["every"] + 1) * trajectory["every"])
+    return min(t_next, time_sim)
+
+
+def check_recording(N, time_sim, n_sims, record_every, trajectory, engine):
+    # warning message for an invalid number of colonies or recording options, None if they are fine
+    if n_sims < 0:
+        return "n_sims must be 0 or more"
+    if int(record_every) != record_every or record_every < 1:
+        return "record_every must be a whole number of seconds (>= 1)"
+    if trajectory is None:
+        return None
+    if resolve_engine(engine) == "aggregate":
+        return "the aggregate engine has no individual ants, please choose another engine to record trajectories"
+    if trajectory["recorded"].shape != (int(time_sim) // trajectory["every"] + 1, int(n_sims)) or \
+            any(trajectory[f].shape[2] != int(N) for f in trajectory["features"]):
+        return "the trajectory buffers do not match N, time_sim and n_sims (see new_trajectory)"
+    return None
+
+
+# ---------------------------#
+#	CHECKPOINTS			#
+# ---------------------------#
+def canonical_seed(seed):
+    # int and SeedSequence seeds as (entropy, spawn_key); None and Generators cannot be replayed
+    if isinstance(seed, (int, np.integer)):
+        seed = np.random.SeedSequence(int(seed))
+    if isinstance(seed, np.random.SeedSequence):
+        return {"entropy": seed.entropy, "spawn_key": list(seed.spawn_key), "pool_size": seed.pool_size}
+    return None
+
+
+def run_parameters(N, Nf, time_sim, par, behavior, method_sb, n_sims, batched, engine, record_every, seed=None):
+    # what a checkpoint must share with the run resuming it (a Generator seed only matches another Generator seed)
+    return {"version": model_version, "N": int(N), "Nf": min(int(Nf), int(N)), "time_sim": int(time_sim),
+            "par": {k: v for k, v in par.items() if np.isscalar(v)}, "behavior": int(behavior), "method_sb": method_sb,
+            "n_sims": int(n_sims), "batched": bool(batched), "engine": resolve_engine(engine),
+            "record_every": int(record_every),
+            "seed": "generator" if isinstance(seed, np.random.Generator) else canonical_seed(seed)}
+
+
+def open_checkpoint(path, params, every=600):
+    # checkpoint of a run in the file `path`, saved at most every `every` seconds (wall clock) at a recording time;
+    # if the file exists, the run resumes from it; an unseeded run (seed None) takes the seed of the saved one.
+    # Returns (checkpoint, None) or (None, warning)
+    if params["engine"] not in ("step", "compiled"):
+        return None, "checkpoints need the step or compiled engine"
+    state = None
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None, "the checkpoint %s cannot be read" % path
+        if params["seed"] is None:
+            params = dict(params, seed=state["params"].get("seed"))
+        if state["params"] != params:
+            return None, "the checkpoint %s was written by a run with other parameters or another seed" % path
+    return {"path": path, "every": every, "params": params, "state": state, "blocks": [],
+            "saved": time.perf_counter()}, None
+
+
+def _resume(checkpoint, gens):
+    # restores the random streams of a saved run; returns the batch to start from and its state (None: a new batch)
+    state = checkpoint["state"]
+    if state is None:
+        return 0, None
+    for g, s in zip(gens, state["rng"]):
+        g.bit_generator.state = s
+    checkpoint["blocks"] = list(state["blocks"])
+    return state["batch"], state["run"]
+
+
+def _save_checkpoint(checkpoint, gens, batch, run=None, force=False):
+    # run: (t, colonies, dat) of the running batch, None once it is finished
+    if not force and time.perf_counter() - checkpoint["saved"] < checkpoint["every"]:
+        return
+    state = {"params": checkpoint["params"], "batch": batch, "run": run, "blocks": checkpoint["blocks"],
+             "rng": [g.bit_generator.state for g in gens]}
+    tmp = checkpoint["path"] + ".%d.tmp" % os.getpid()  # an interrupted save leaves the previous checkpoint intact
+    with open(tmp, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, checkpoint["path"])
+    checkpoint["saved"] = time.perf_counter()
+
+
+def _feed_trophallaxis(dat, feeders, par, rng, prof=None):
+    # feeders: (n_sims, Nf) mask; returns the colonies that had somebody to feed in the nest
+    fed, qliquid = dat["fed"], dat["qliquid"]
+    n_sims, N = fed.shape
+    Nf = feeders.shape[1]
+    fed_vol = par["fed_vol"]
+    empty = (fed < 1) & (dat["where"] == 0)
+    n_empty = np.count_nonzero(empty, axis=1)
+    feeders = feeders & (n_empty > 0)[:, None]
+    # 1/feeding_time * probability to find empty ant
+    act = _draw(feeders, np.repeat(par["p_feed_t"] * n_empty / N, np.count_nonzero(feeders, axis=1)), rng)
+    q = qliquid[:, :Nf]
+    full = act & (q >= fed_vol)
+    n_full = np.count_nonzero(full, axis=1)
+    part = act & (q < fed_vol) & (n_full == 0)[:, None]  # if they only have less qliquid than fed volume
+    # we choose randomly which individual is fed with fed_vol; cannot feed more ants than there are empty ones
+    k = np.minimum(n_full, n_empty)
+    rows, cols = _sample_without_replacement(empty, k, rng)
+    fed[rows, cols] = 1
+    if prof is not None:
+        prof["events"]["feedings"] += len(rows)
+    rows, cols = np.nonzero(full)
+    keep = _rank_in_row(rows, n_sims) < k[rows]
+    q[rows[keep], cols[keep]] -= fed_vol
+    if part.any():
+        rows, cols = _sample_with_replacement(empty, np.count_nonzero(part, axis=1), rng)  # select how many indivs to feed
+        n_fed = np.bincount(rows, minlength=n_sims)
+        prow, pcol = np.nonzero(part)
+        sel = _rank_in_row(prow, n_sims) == n_fed[prow] - 1
+        q_feed = np.zeros(n_sims)
+        q_feed[prow[sel]] = q[prow[sel], pcol[sel]]  # feed them with remaining stuff
+        fed[rows, cols] = q_feed[rows] / fed_vol
+        fed[rows, cols] = np.where(fed[rows, cols] > 0.9, 1, fed[rows, cols])  # more than 90% are considered full
+        q[part] = 0  # individuals that passed liquid get to zero
+        if prof is not None:
+            prof["events"]["feedings"] += len(rows)
+    return n_empty > 0
+
+
+def _feed_social_bucket(dat, feeders, par, method_sb, rng, prof=None):
+    fed, qliquid = dat["fed"], dat["qliquid"]
+    n_sims, N = fed.shape
+    Nf = feeders.shape[1]
+    empty = (fed < 1) & (dat["where"] == 0)
+    n_empty = np.count_nonzero(empty, axis=1)
+    feeders = feeders & (n_empty > 0)[:, None]
+    rows, cols = np.nonzero(feeders)
+    n_feeds = rng.integers(1, 4, len(rows))  # each forager feeds 1-3 ants at once
+    act = rng.random(len(rows)) < 1 / (2 / (n_empty[rows] / N) + 0.524 * n_feeds)
+    q_feed = rng.random(len(rows))  # random percentatge of food to pass
+    q_feed = np.where(q_feed > 0.9, 1, q_feed)  # if they pass more than 90%, let's say they pass everything
+    q_feed *= qliquid[rows, cols]  # determine quantity in liquid
+    rows, cols, n_feeds, q_feed = rows[act], cols[act], n_feeds[act], q_feed[act]
+    qliquid[rows, cols] -= q_feed  # individuals pass liquid
+    # amount passed is divided by the numbers of individuals engaged with each forager
+    portions = np.repeat(q_feed / n_feeds, n_feeds)
+    prow = np.repeat(rows, n_feeds)
+    k = np.minimum(np.bincount(prow, minlength=n_sims), n_empty)
+    portions = portions[_rank_in_row(prow, n_sims) < k[prow]]
+    rows, cols = _sample_without_replacement(empty, k, rng)  # cannot choose same indiv twice
+    fed[rows, cols] += portions / par["fed_vol"]
+    if prof is not None:
+        prof["events"]["feedings"] += len(rows)
+    ###################################
+    #	METHOD SB: COMPLEX VS SIMPLE  #
+    ###################################
+    if method_sb == "complex":
+        fed[rows, cols] = np.where((fed[rows, cols] > 0.9) & (fed[rows, cols] < 1), 1, fed[rows, cols])
+        over = fed > 1
+        n_over = np.count_nonzero(over, axis=1)
+        if n_over.any():
+            receivers = (fed < 1) & (dat["where"] == 0)
+            q_over = np.where(over, fed - 1, 0).sum(axis=1)
+            fed[over] = 1  # if last individuals are overfed, the excess is lost
+            # overfed individuals pass the excess to random receivers
+            n_over[np.count_nonzero(receivers, axis=1) == 0] = 0
+            rows, cols = _sample_with_replacement(receivers, n_over, rng)
+            n_recv = np.bincount(rows, minlength=n_sims)
+            if prof is not None:
+                prof["events"]["redistributions"] += int(n_over.sum())
+            fed[rows, cols] = np.minimum(fed[rows, cols] + q_over[rows] / n_recv[rows], 1)  # nobody receives more than 1
+    else:
+        fed[rows, cols] = np.where(fed[rows, cols] > 0.9, 1, fed[rows, cols])  # simplified version, even if they have more than 1
+    return n_empty > 0
+
+
+def _empty_liquid(qliquid, mask):
+    # those with less than 10% are considered empty, just in case of miss-adjustment
+    qliquid[mask & (qliquid < 0.1)] = 0
+
+
+def feed_in_nest(dat, Nf_tropha, Nf_sb, Nf_trsb, par, method_sb, rng, prof=None):
+    # masks of loaded foragers (first Nf columns) sharing by trophallaxis, social bucket or both
+    qliquid = dat["qliquid"][:, :Nf_tropha.shape[1]]
+    # 2.1 - Trophallaxis
+    if Nf_tropha.any():
+        t0 = time.perf_counter() if prof is not None else None
+        fed_rows = _feed_trophallaxis(dat, Nf_tropha, par, rng, prof)
+        _empty_liquid(qliquid, Nf_tropha & fed_rows[:, None])
+        if prof is not None:
+            _tick(prof, "2.1 trophallaxis", t0)
+    # 2.2 - SB
+    if Nf_sb.any():
+        t0 = time.perf_counter() if prof is not None else None
+        fed_rows = _feed_social_bucket(dat, Nf_sb, par, method_sb, rng, prof)
+        _empty_liquid(qliquid, Nf_sb & fed_rows[:, None])
+        if prof is not None:
+            _tick(prof, "2.2 social bucket", t0)
+    # Trophallaxis + SB together
+    if Nf_trsb.any():
+        t0 = time.perf_counter() if prof is not None else None
+        # if ant have more than max liquid tropha, they do social bucket
+        # elif liquid is EQUAL or less than max liquid tropha (for the whole colony), they do trophallaxis action.
+        antsb = Nf_trsb & (qliquid > par["v_t"])
+        sb_rows = antsb.any(axis=1)
+        if sb_rows.any():
+            _feed_social_bucket(dat, antsb, par, method_sb, rng, prof)
+        if not sb_rows.all():
+            _feed_trophallaxis(dat, Nf_trsb & ~sb_rows[:, None], par, rng, prof)
+        _empty_liquid(qliquid, Nf_trsb)
+        if prof is not None:
+            _tick(prof, "2.3 trophallaxis + SB", t0)
+
+
+def model_step(dat, Nf, par, method_sb, rng, prof=None):
+    # views on the foragers (first Nf columns) of every colony
+    # times and volumes depend on each ant's behav, through the lookup tables of model_parameters
+    # prof: profile dict (see new_profile) or None; timing costs nothing when it is None
+    t0 = time.perf_counter() if prof is not None else None
+    fw, fn, fb = dat["where"][:, :Nf], dat["naif"][:, :Nf], dat["behav"][:, :Nf]
+    timing, max_time, qliquid = dat["timing"][:, :Nf], dat["max_time"][:, :Nf], dat["qliquid"][:, :Nf]
+    # SELECT NAIF INDIVIDUALS DEPENDING ON WHERE
+    Nf_in = (fw == 0) & (fn == 0)  # who is in nest and naif
+    Nf_out = (fw == 1) & (fn == 0)  # who is outside and naif
+    Nf_source = fw == 2  # who is at the source
+    Nf_ret = fw == 3  # who is going back to nest
+    loaded = (fw == 0) & (fn == 1) & (qliquid > 0)  # foragers with liquid to share
+    Nf_tropha = loaded & (fb == 1)
+    Nf_sb = loaded & (fb == 0)
+    Nf_trsb = loaded & (fb == 2)
+    # -------------------------#
+    # 1- ANTS INSIDE NEST phase#
+    # -------------------------#
+    # 1.1 see if naif go out
+    fw[_draw(Nf_in, par["p_out"], rng)] = 1
+    # 1.2. informed empty ants go out
+    temp = (fw == 0) & (fn == 1) & (qliquid == 0)
+    fw[temp] = 1
+    timing[temp] = -1  # -1 because in the phase "outside" they get +1 timing, so they are at zero at the end of timestep
+    if prof is not None:
+        _tick(prof, "1 nest exit", t0)
+    # -------------------------------------------#
+    # 2- TROPHALLAXIS & SOCIAL BUCKET INSIDE NEST#
+    # -------------------------------------------#
+    feed_in_nest(dat, Nf_tropha, Nf_sb, Nf_trsb, par, method_sb, rng, prof)
+    t0 = time.perf_counter() if prof is not None else None
+    # ---------------------------------------------------------#
+    # 3- ANTS OUTSIDE phase, exploring arena or going to source#
+    # ---------------------------------------------------------#
+    # 3.1 Naif ants outside
+    if Nf_out.any():
+        back = _draw(Nf_out, par["p_nest"], rng)  # probability to go back to nest
+        fw[back] = 0
+        temp = _draw(Nf_out & ~back, par["p_source"], rng)  # those still outside that get to source
+        fw[temp] = 2
+        fn[temp] = 1
+        max_time[temp] = par["t_load"][fb[temp]]
+        dat["fed"][:, :Nf][temp] = 1
+    if prof is not None:
+        t0 = _tick(prof, "3.1 exploration", t0)
+    # 3.2- for informed
+    temp = (fw == 1) & (fn == 1) & (timing == max_time)  # select those that ARRIVE to source
+    fw[temp] = 2
+    timing[temp] = 0
+    max_time[temp] = par["t_load"][fb[temp]]
+    timing[(fw == 1) & (fn == 1)] += 1  # who is outside and Informed, increase timing by 1
+    if prof is not None:
+        t0 = _tick(prof, "3.2 walk to source", t0)
+    # ---------------------------#
+    # 4- ANTS AT THE SOURCE phase#
+    # ---------------------------#
+    if Nf_source.any():
+        temp = Nf_source & (timing == max_time)  # select those that are full
+        timing[Nf_source & ~temp] += 1  # who is at source, increase timing by 1
+        fw[temp] = 3  # return (3), reboot timing, max_time & qliquid
+        timing[temp] = 0
+        max_time[temp] = par["dist"][fb[temp]]
+        qliquid[temp] = par["volume"][fb[temp]]
+    if prof is not None:
+        t0 = _tick(prof, "4 source", t0)
+    # --------------------------------#
+    # 5- ANTS GOING BACK TO NEST phase#
+    # --------------------------------#
+    if Nf_ret.any():
+        temp = Nf_ret & (timing == max_time)  # select those that get back into the nest
+        timing[Nf_ret & ~temp] += 1  # who is returning, increase timing by 1
+        fw[temp] = 0
+        timing[temp] = 0
+        temp &= fb != 1  # social bucket may drop the liquid on the way, one draw for all of them
+        if temp.any():
+            temp = _draw(temp, par["p_drop"][fb[temp]], rng)
+            qliquid[temp & (fb == 0)] = 0
+            qliquid[temp & (fb == 2)] -= par["v_sb"]  # both: only the social bucket part is lost
+            if prof is not None:
+                prof["events"]["drops"] += int(np.count_nonzero(temp))
+    if prof is not None:
+        _tick(prof, "5 return", t0)
+
+
+def record_results(dat, t, colonies):
+    # one results row per colony: fed, inside, outside, source, informed, time, colony
+    where = dat["where"]
+    res = np.empty((len(colonies), 7))
+    res[:, 0] = np.sum(dat["fed"], axis=1)  # number of fed ants
+    res[:, 1] = np.count_nonzero(where == 0, axis=1)  # number of ants inside
+    res[:, 2] = np.count_nonzero((where == 1) | (where == 3), axis=1)  # ants outside
+    res[:, 3] = np.count_nonzero(where == 2, axis=1)  # ants at source
+    res[:, 4] = np.count_nonzero(dat["naif"] == 1, axis=1)  # ants that visited the source
+    res[:, 5] = t  # timestep
+    res[:, 6] = colonies
+    return res
+
+
+def resolve_engine(engine):
+    # the engine actually used for `engine`: "auto" is "compiled" when Numba is installed, "step" otherwise
+    if engine == "auto":
+        return "compiled" if importlib.util.find_spec("numba") is not None else "step"
+    return engine
+
+
+def check_model(D, visco='NA', sugar='NA', behavior=1, terrain=0, method_sb="simple", engine="step"):
+    if engine not in engines:
+        warning_message = "please choose an engine: " + ", ".join("'%s'" % e for e in engines)
+        return None, warning_message
+    if resolve_engine(engine) == "compiled" and importlib.util.find_spec("numba") is None:
+        warning_message = "the compiled engine needs Numba (pip install numba), please choose another engine"
+        return None, warning_message
+    if behavior not in range(0, 3):
+        warning_message = "Behaviour is not defined."  # -- add n 2 = first tropha, and then grab, both beh at same time
+        return None, warning_message
+    if behavior != 1 and method_sb not in ("simple", "complex"):
+        warning_message = "please choose a method_sb: 'complex' or 'simple', default option is 'simple'"
+        return None, warning_message
+    return model_parameters(D, visco, sugar, terrain)
+
+
+def simulate(N, Nf, time_sim, par, behavior=1, method_sb="simple", n_sims=1, batched=True, seed=None, stop=None,
+             engine="step", prof=None, record_every=10, trajectory=None, checkpoint=None):
+    # yields a block of results rows (one per running colony) every record_every seconds, starting at t=0
+    # stop(row) -> True ends that colony after the row has been yielded
+    # trajectory: per-ant buffers of new_trajectory, filled every trajectory["every"] seconds
+    # checkpoint: see open_checkpoint; a resumed run first yields the blocks of the saved run
+    engine = resolve_engine(engine)
+    record_every = int(record_every)
+    args = (N, Nf, time_sim, par, behavior, method_sb, n_sims, batched, seed, stop, prof, record_every, trajectory)
+    if engine == "compiled":
+        from AntVenture_kernel import simulate_compiled
+        yield from simulate_compiled(*args, checkpoint)
+        return
+    if engine == "events":
+        from AntVenture_events import simulate_events
+        yield from simulate_events(*args)
+        return
+    if engine == "large":
+        from AntVenture_large import simulate_large
+        yield from simulate_large(*args)
+        return
+    if engine == "aggregate":
+        from AntVenture_aggregate import simulate_aggregate
+        yield from simulate_aggregate(*args)
+        return
+    N, time_sim, n_sims = int(N), int(time_sim), int(n_sims)
+    Nf = min(int(Nf), N)  # cannot have more foragers than ants
+    batches = [np.arange(n_sims)] if batched else np.arange(n_sims)[:, None]
+    gens = spawn_generators(seed, len(batches))
+    first, run = _resume(checkpoint, gens) if checkpoint is not None else (0, None)
+    if checkpoint is not None:
+        yield from checkpoint["blocks"]
+    for b in range(first, len(batches)):
+        colonies, rng = batches[b], gens[b]
+        # -----------------------#
+        #	START: CREATE TABLE	#
+        # -----------------------#
+        dat = create_colony(N, Nf, behavior, len(colonies))
+        start = 0
+        if run is not None:  # resumed in the middle of this batch
+            start, colonies, dat = run[0] + 1, run[1], run[2]
+            run = None
+        for t in range(start, time_sim + 1):
+            if t > 0:
+                model_step(dat, Nf, par, method_sb, rng, prof)
+            if trajectory is not None and t % trajectory["every"] == 0:
+                _capture(trajectory, dat, t, colonies)
+            if t % record_every == 0:
+                t0 = time.perf_counter() if prof is not None else None
+                res = record_results(dat, t, colonies)
+                if prof is not None:
+                    _tick(prof, "record", t0)
+                yield res
+                if checkpoint is not None:
+                    checkpoint["blocks"].append(res)
+                if stop is not None:
+                    running = np.array([not stop(row) for row in res], dtype=bool)
+                    if not running.all():  # finished colonies leave the batch
+                        colonies = colonies[running]
+                        dat = {c: v[running] for c, v in dat.items()}
+                        if len(colonies) == 0:
+                            break
+                if checkpoint is not None:
+                    _save_checkpoint(checkpoint, gens, b, (t, colonies, dat))
+    if checkpoint is not None:
+        _save_checkpoint(checkpoint, gens, len(batches), force=True)
+
+
+def _open_profile(profile):
+    # profile: None (no instrumentation), a dict filled in place (see new_profile) or a callback receiving it at the end
+    if profile is None:
+        return None
+    if isinstance(profile, dict):
+        for k, v in new_profile().items():
+            profile.setdefault(k, v)
+        return profile
+    return new_profile()
+
+
+def _close_profile(profile, prof, t0):
+    prof["time"]["total"] = prof["time"].get("total", 0) + time.perf_counter() - t0
+    prof["calls"]["total"] = prof["calls"].get("total", 0) + 1
+    if callable(profile):
+        profile(prof)
+
+
+def stop_when_fed(N, fraction=0.5):
+    # stopping predicate: the colony has reached `fraction` of fed ants
+    return lambda row: row[0] >= int(N * fraction)
+
+
+#Define model
+def diacamma_model(N, Nf, D, time_sim, visco='NA', sugar='NA', behavior=1, terrain=0, method_sb="simple", n_sims=1,
+                   batched=True, seed=None, engine="step", profile=None, record_every=10, trajectory=None,
+                   checkpoint=None, checkpoint_every=600):
+    # batched=True advances all n_sims colonies together as one (n_sims x N) state; batched=False runs them one
+    # after the other, which keeps memory at a single colony for very large N
+    # seed: int, np.random.SeedSequence or np.random.Generator; every random number of the run is drawn from it
+    # engine: "step" (default) updates every ant every second; "compiled" does the same in a Numba kernel ("auto" picks
+    # it when Numba is installed, "step" otherwise, so seeded results of "auto" depend on the environment, and the
+    # kernel takes ~0.5 s to load, which only pays off over many or long runs); "events" schedules travel and loading as future events, which
+    # scales much better with long distances and long simulations; "large" runs one colony at a time with index sets of
+    # hungry ants and foragers, for colonies of 10^5 - 10^6 ants; "aggregate" only counts ants per compartment, with a
+    # cost independent of colony size (aggregate curves only, see AntVenture_aggregate.validate)
+    # profile: dict filled with the time and calls per phase and event counts (see new_profile, profile_table), or a
+    # callback receiving that dict at the end of the run; None (default) adds no cost. "auto" runs "step" when profiled,
+    # as the compiled kernel has no phases to report
+    # record_every: seconds between two results rows of a colony
+    # trajectory: per-ant buffers from new_trajectory(N, time_sim, n_sims, every, features, path), filled in place with
+    # the state of every ant every `every` seconds (not with the aggregate engine)
+    # checkpoint: file where the whole state of the run (colonies, time, results so far, random streams) is saved every
+    # checkpoint_every seconds of computing and at the end; if it exists, the run resumes from it (step and compiled
+    # engines; frames captured in an in-memory trajectory before the restart are not restored)
+    if profile is not None and engine == "auto":
+        engine = "step"
+    par, warning_message = check_model(D, visco, sugar, behavior, terrain, method_sb, engine)
+    if par is None:
+        return None, warning_message
+    warning = check_recording(N, time_sim, n_sims, record_every, trajectory, engine)
+    if warning is not None:
+        return None, warning
+    if checkpoint is not None:
+        checkpoint, warning = open_checkpoint(checkpoint, run_parameters(N, Nf, time_sim, par, behavior, method_sb,
+                                                                         n_sims, batched, engine, record_every, seed),
+                                              checkpoint_every)
+        if checkpoint is None:
+            return None, warning
+    prof = _open_profile(profile)
+    t0 = time.perf_counter()
+    res = np.vstack(list(simulate(N, Nf, time_sim, par, behavior, method_sb, n_sims, batched, seed, engine=engine,
+                                  prof=prof, record_every=record_every, trajectory=trajectory,
+                                  checkpoint=checkpoint)))
+    res = res[np.lexsort((res[:, 5], res[:, 6]))]  # colony by colony
+    import pandas as pd
+    fin_res = pd.DataFrame(res, columns=results_columns,
+                           index=np.tile(np.arange(int(time_sim) // int(record_every) + 1), int(n_sims)))
+    if prof is not None:
+        _close_profile(profile, prof, t0)
     return fin_res, warning_message
 
 
-''' 
-#uncomment this section to run several conditions in a loop
-
-#Choose parameters to test
-colonysize=[20, 40, 80, 160]
-propforagers=[5, 40]
-distancesource=[20, 100]
-terraindiff=[0, 1]
-sugarcon=[0.1, 0.3, 0.5]
-behaviortsb=[0, 1, 2]
-
-import itertools
-# Generate all combinations
-combi = list(itertools.product(colonysize, propforagers, distancesource, terraindiff, sugarcon, behaviortsb))
-
-columns=['colonysize', 'propforagers', 'distancesource', 'terraindiff', 'sugarcon', 'behaviortsb']
-# Create a DataFrame to store the combinations
-combi = pd.DataFrame(combi, columns=columns)
-
-# Create empty results DataFrame
-columns=['colonysize', 'propforagers', 'distancesource', 'terraindiff', 'sugarcon', 'behaviortsb']
-columns += ['fed', 'time', 'colony']
-results=pd.DataFrame(columns=columns)
-
-#start iterating
-for i in combi.itertuples(index=False):
-    res, warn =diacamma_model(N = i.colonysize, Nf = i.propforagers, D= i.distancesource, time_sim = 30, sugar = i.sugarcon, behavior = i.behaviortsb, terrain= i.terraindiff, n_sims = 10)
-    #get row with %50 colony fed, or the closest value
-    for c in res['colony'].unique():
-        temp_res=res.loc[res['colony']==c]
-        indt=temp_res.loc[temp_res['fed']<int(i.colonysize/2)].index[-1]
-        #if simulation didn't arrive to %50 value we take highest value, to estimate needed time
-        if indt == len(temp_res)-1:
-            temp=list(temp_res.loc[indt, ['fed', 'time', 'colony']])
-        #we take %50 value
-        else:
-            temp=list(temp_res.loc[indt+1, ['fed', 'time', 'colony']])
-        results.loc[len(results)]=[*list(i),*temp] # use * to unpack lists, double [[]] to concat in a single row
-
-results.to_csv('example.csv', index=False)
-'''
+def iter_diacamma_model(N, Nf, D, time_sim, visco='NA', sugar='NA', behavior=1, terrain=0, method_sb="simple",
+                        n_sims=1, batched=True, seed=None, stop=None, engine="step", profile=None, record_every=10,
+                        trajectory=None, checkpoint=None, checkpoint_every=600):
+    # streaming version of diacamma_model: returns a generator of results rows (fed, inside, outside, source, informed,
+    # time, colony) yielded every record_every seconds as they are produced; nothing is kept in memory
+    # stop(row) -> True ends that colony early, e.g. stop=stop_when_fed(N, 0.5)
+    # profile, trajectory: as in diacamma_model, complete once the generator is exhausted
+    # checkpoint: as in diacamma_model (keeps the rows produced so far in memory); a resumed run yields them again first
+    if profile is not None and engine == "auto":
+        engine = "step"
+    par, warning_message = check_model(D, visco, sugar, behavior, terrain, method_sb, engine)
+    if par is None:
+        return None, warning_message
+    warning = check_recording(N, time_sim, n_sims, record_every, trajectory, engine)
+    if warning is not None:
+        return None, warning
+    if checkpoint is not None:
+        checkpoint, warning = open_checkpoint(checkpoint, run_parameters(N, Nf, time_sim, par, behavior, method_sb,
+                                                                         n_sims, batched, engine, record_every, seed),
+                                              checkpoint_every)
+        if checkpoint is None:
+            return None, warning
+    prof = _open_profile(profile)
+    blocks = simulate(N, Nf, time_sim, par, behavior, method_sb, n_sims, batched, seed, stop, engine, prof,
+                      record_every, trajectory, checkpoint)
+    return _iter_rows(blocks, profile, prof), warning_message
+
+
+def _iter_rows(blocks, profile, prof):
+    t0 = time.perf_counter()
+    for res in blocks:
+        yield from res
+    if prof is not None:
+        _close_profile(profile, prof, t0)
+
+
+# To run several conditions in a loop (parameter sweeps), see AntVenture_sweep.py
@@ -0,0 +1,128 @@
+# Summary statistics for AntVenture: Sims results
+# Work on the results of diacamma_model / run_sweep (DataFrames) or on chunked result directories (AntVenture_io), in
+# vectorized passes over all colonies and grid cells at once:
+#   time_to_fed: time at which each colony reaches X% fed, for several X, with a censoring flag when it never does
+#   curves: mean, standard deviation and quantiles over colonies of a column, per grid cell and time
+#   bootstrap_ci: bootstrap confidence interval of the mean of a summary, per grid cell
+# Usage: ttf = time_to_fed("sweep_out", thresholds=(0.5, 0.9)); bootstrap_ci(ttf, "time_50")
+
+import numpy as np
+import pandas as pd
+
+from AntVenture_sweep import grid_columns
+
+
+def _frames(source, columns=None, where=None):
+    # DataFrames of a result: the DataFrame itself, or the chunks of a result directory (only `columns`)
+    if isinstance(source, pd.DataFrame):
+        yield source
+    else:
+        from AntVenture_io import iter_chunks
+        yield from iter_chunks(source, columns, where)
+
+
+def _keys(columns):
+    # grid cell columns present in the results
+    return [c for c in grid_columns if c in columns]
+
+
+def _read_columns(source):
+    if isinstance(source, pd.DataFrame):
+        return list(source.columns)
+    from AntVenture_io import read_meta
+    return read_meta(source)["columns"]
+
+
+def _label(threshold):
+    return "%g" % (threshold * 100)
+
+
+def time_to_fed(source, thresholds=(0.5,), N=None, where=None):
+    # one row per colony (and grid cell): time_X = first recorded time with fed >= int(N * X), as stop_when_fed, and
+    # censored_X = True if that never happens (time_X is then the last recorded time)
+    # N: colony size, taken from the colonysize column of sweep results
+    thresholds = np.atleast_1d(thresholds)
+    keys = _keys(_read_columns(source)) + ["colony"]
+    need = keys + ["fed", "time"]
+    parts = []
+    for df in _frames(source, need, where):
+        size = df["colonysize"].to_numpy() if "colonysize" in df else N
+        if size is None:
+            raise ValueError("N is needed when the results have no colonysize column")
+        target = (np.asarray(size, dtype=float)[..., None] * thresholds).astype(int)  # int(N * X)
+        reached = df["fed"].to_numpy()[:, None] >= target
+        time = df["time"].to_numpy().astype(float)
+        first = np.where(reached, time[:, None], np.inf)
+        part = pd.DataFrame(first, columns=["time_" + _label(x) for x in thresholds])
+        for k in keys:
+            part[k] = df[k].to_numpy()
+        part["last"] = time
+        # earliest time reached and last time recorded per colony in this frame; frames combined below
+        parts.append(part.groupby(keys, sort=False).agg(dict({c: "min" for c in part.columns[:len(thresholds)]},
+                                                             last="max")))
+    if not parts:
+        return pd.DataFrame(columns=keys + [p + _label(x) for x in thresholds for p in ("time_", "censored_")])
+    res = pd.concat(parts)
+    if len(parts) > 1:
+        res = res.groupby(level=list(range(len(keys)))).agg(dict({c: "min" for c in res.columns[:-1]}, last="max"))
+    res = res.sort_index().reset_index()
+    for x in thresholds:
+        col = "time_" + _label(x)
+        res["censored_" + _label(x)] = np.isinf(res[col])
+        res[col] = np.where(res["censored_" + _label(x)], res["last"], res[col])
+    return res.drop(columns="last")
+
+
+def curves(source, column="fed", quantiles=(0.05, 0.5, 0.95), where=None):
+    # per grid cell and time: number of colonies, mean, sd and quantiles of `column` over colonies
+    # (needs full curves, i.e. diacamma_model results or run_sweep(curves=True)); mean and sd are accumulated chunk by
+    # chunk, quantiles need the whole column of each cell and time, so only those columns are read
+    keys = _keys(_read_columns(source)) + ["time"]
+    sums = []
+    values = []
+    for df in _frames(source, keys + [column], where):
+        v = df[column].astype(float)
+        g = pd.DataFrame({"n": 1, "s": v, "s2": v ** 2}).groupby([df[k] for k in keys], sort=False).sum()
+        sums.append(g)
+        if len(quantiles):
+            values.append(df[keys + [column]])
+    g = pd.concat(sums)
+    g = g.groupby(level=list(range(len(keys)))).sum()
+    res = pd.DataFrame({"n": g["n"], "mean": g["s"] / g["n"]})
+    res["sd"] = np.sqrt(np.maximum(g["s2"] / g["n"] - res["mean"] ** 2, 0) * g["n"] / np.maximum(g["n"] - 1, 1))
+    if len(quantiles):
+        q = pd.concat(values).groupby(keys)[column].quantile(list(quantiles)).unstack()
+        q.columns = ["q%g" % (x * 100) for x in quantiles]
+        res = res.join(q)
+    return res.sort_index().reset_index()
+
+
+def bootstrap_ci(summary, column, n_boot=2000, ci=0.95, seed=None, by=None):
+    # per group (grid cell by default): mean of `column` and its percentile bootstrap interval; all groups are
+    # resampled together, n_boot resamples at a time as long as they fit in ~10^7 draws
+    by = _keys(summary.columns) if by is None else list(by)
+    df = summary.sort_values(by) if by else summary
+    values = df[column].to_numpy(dtype=float)
+    if by:
+        gid = df.groupby(by, sort=True).ngroup().to_numpy()
+        index = df[by].drop_duplicates().reset_index(drop=True)
+    else:
+        gid = np.zeros(len(df), dtype=int)
+        index = pd.DataFrame(index=[0])
+    counts = np.bincount(gid)
+    starts = np.cumsum(counts) - counts
+    rng = np.random.default_rng(seed)
+    boot = np.empty((n_boot, len(counts)))
+    block = max(1, int(1e7 // max(len(values), 1)))
+    rows = np.repeat(np.arange(len(counts)), counts)
+    for b in range(0, n_boot, block):
+        m = min(block, n_boot - b)
+        # every resample draws counts[g] values with replacement inside each group g
+        idx = starts[rows] + (rng.random((m, len(values))) * counts[rows]).astype(int)
+        boot[b:b + m] = np.add.reduceat(values[idx], starts, axis=1) / counts
+    alpha = (1 - ci) / 2
+    res = index.copy()
+    res["n"] = counts
+    res["mean"] = np.bincount(gid, values) / counts
+    res["low"], res["high"] = np.quantile(boot, [alpha, 1 - alpha], axis=0)
+    return res
@@ -0,0 +1,408 @@
+# Parameter sweeps for AntVenture: Sims
+# Runs diacamma_model over a grid of conditions (colony size, foragers, distance, terrain, sugar, behaviour),
+# spreading grid cells and replicates over a pool of worker processes.
+# Usage: python AntVenture_sweep.py --workers 8 --n-sims 10 --output example.csv
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from AntVenture_cache import (cache_get, cache_key, cache_put, canonical, canonical_parameters, canonical_seed,
+                              open_cache)
+from AntVenture_io import close_writer, formats, open_writer, write_results, write_rows
+from AntVenture_sims import engines, iter_diacamma_model, model_version, resolve_engine, results_columns, stop_when_fed
+
+grid_columns = ['colonysize', 'propforagers', 'distancesource', 'terraindiff', 'sugarcon', 'behaviortsb']
+# default grid, as in the original example sweep
+default_grid = {'colonysize': [20, 40, 80, 160], 'propforagers': [5, 40], 'distancesource': [20, 100],
+                'terraindiff': [0, 1], 'sugarcon': [0.1, 0.3, 0.5], 'behaviortsb': [0, 1, 2]}
+
+
+def sweep_columns(curves=False):
+    # columns of run_sweep results
+    return grid_columns + (results_columns if curves else ['fed', 'time', 'colony'])
+
+
+def sweep_grid(colonysize, propforagers, distancesource, terraindiff, sugarcon, behaviortsb):
+    # Generate all combinations, one row per grid cell
+    combi = list(itertools.product(colonysize, propforagers, distancesource, terraindiff, sugarcon, behaviortsb))
+    return pd.DataFrame(combi, columns=grid_columns)
+
+
+def _run_cell(cell, colonies, time_sim, method_sb, curves, seed, engine, record_every=10, fraction=0.5):
+    # worker task: replicates `colonies` of one grid cell; returns an array with the grid values in front
+    # seed is the task's own SeedSequence child, so workers never share a random stream
+    # without curves, each colony is stopped as soon as 50% (fraction) of it is fed and only that last row is kept
+    # (if simulation didn't arrive to 50% value we keep the last row, to estimate needed time); fraction=None keeps the
+    # row at the end of the simulation
+    stop = None if curves or fraction is None else stop_when_fed(cell['colonysize'], fraction)
+    rows, warn = iter_diacamma_model(N=cell['colonysize'], Nf=cell['propforagers'], D=cell['distancesource'],
+                                     time_sim=time_sim, sugar=cell['sugarcon'], behavior=cell['behaviortsb'],
+                                     terrain=cell['terraindiff'], method_sb=method_sb, n_sims=len(colonies),
+                                     seed=seed, stop=stop, engine=engine, record_every=record_every)
+    if rows is None:
+        return None, warn
+    if curves:
+        res = np.array(list(rows))
+        res = res[np.lexsort((res[:, 5], res[:, 6]))]  # colony by colony
+    else:
+        last = {}
+        for row in rows:
+            last[row[6]] = row
+        res = np.array([last[c] for c in sorted(last)])[:, [0, 5, 6]]  # fed, time, colony
+    res[:, -1] = np.asarray(colonies)[res[:, -1].astype(int)]
+    values = np.repeat([[cell[c] for c in grid_columns]], len(res), axis=0)
+    return np.hstack([values, res]), warn
+
+
+def _progress(done, total, t0):
+    elapsed = time.time() - t0
+    eta = elapsed / done * (total - done)
+    sys.stderr.write("\r%d/%d tasks done, elapsed %.0fs, ETA %.0fs " % (done, total, elapsed, eta))
+    if done == total:
+        sys.stderr.write("\n")
+    sys.stderr.flush()
+
+
+def _task_key(cell, colonies, time_sim, method_sb, curves, seed, engine, record_every=10):
+    params, warn = canonical_parameters(cell['colonysize'], cell['propforagers'], cell['distancesource'], time_sim,
+                                        sugar=cell['sugarcon'], behavior=cell['behaviortsb'],
+                                        terrain=cell['terraindiff'], method_sb=method_sb, engine=engine)
+    if params is not None:
+        params.update(colonies=colonies, curves=curves, grid=[cell[c] for c in grid_columns],
+                      record_every=int(record_every))
+    return cache_key("sweep", params, seed)
+
+
+def _checkpoint_seed(path):
+    # root seed of the sweep checkpointed in path, None if there is none
+    try:
+        with open(os.path.join(path, "sweep.json")) as f:
+            seed = json.load(f)["seed"]
+    except (OSError, ValueError, KeyError):
+        return None
+    return np.random.SeedSequence(seed["entropy"], spawn_key=seed["spawn_key"], pool_size=seed["pool_size"])
+
+
+def _sweep_manifest(cells, time_sim, n_sims, chunk, method_sb, curves, engine, record_every, root):
+    # what a checkpoint directory must share with the sweep resuming it
+    return canonical({"version": model_version, "grid": [[c[k] for k in grid_columns] for c in cells],
+                       "time_sim": time_sim, "n_sims": n_sims, "chunk": min(chunk, n_sims), "method_sb": method_sb,
+                       "curves": curves, "engine": resolve_engine(engine), "record_every": record_every,
+                       "seed": canonical_seed(root)})
+
+
+def _sweep_root(seed, checkpoint):
+    # root SeedSequence of a sweep; an unseeded sweep takes back the seed of the checkpointed one
+    if checkpoint is not None and seed is None:
+        seed = _checkpoint_seed(checkpoint)
+    return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+
+def check_checkpoint(checkpoint, combi, time_sim=30, n_sims=10, method_sb="simple", curves=False, chunk=10, seed=None,
+                     engine="auto", record_every=10):
+    # warning if the checkpoint directory holds another sweep than run_sweep with these arguments, None otherwise;
+    # nothing is written, so it can be checked before opening the output
+    try:
+        with open(os.path.join(checkpoint, "sweep.json")) as f:
+            saved = json.load(f)
+    except OSError:
+        return None
+    cells = combi[grid_columns].to_dict('records')
+    manifest = _sweep_manifest(cells, time_sim, n_sims, chunk, method_sb, curves, engine, record_every,
+                               _sweep_root(seed, checkpoint))
+    if saved != manifest:
+        return "the checkpoint directory %s holds another sweep" % checkpoint
+    return None
+
+
+def _open_checkpoint(path, manifest):
+    # results of the tasks already completed in path (task number -> array); None if path holds another sweep
+    os.makedirs(path, exist_ok=True)
+    name = os.path.join(path, "sweep.json")
+    if os.path.exists(name):
+        with open(name) as f:
+            if json.load(f) != manifest:
+                return None
+    else:
+        with open(name + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(name + ".tmp", name)
+    done = {}
+    for file in os.listdir(path):
+        if file.startswith("task_") and file.endswith(".npy"):
+            done[int(file[5:-4])] = np.load(os.path.join(path, file))
+    return done
+
+
+def _save_task(path, n, res):
+    tmp = os.path.join(path, "task_%d.npy.tmp" % n)  # a task file is either complete or absent
+    with open(tmp, "wb") as f:
+        np.save(f, res)
+    os.replace(tmp, os.path.join(path, "task_%d.npy" % n))
+
+
+def run_sweep(combi, time_sim=30, n_sims=10, method_sb="simple", curves=False, workers=None, chunk=10, seed=None,
+              progress=True, engine="auto", cache=None, writer=None, record_every=10, checkpoint=None):
+    # combi: DataFrame of grid cells (see sweep_grid)
+    # curves=False keeps, per colony, the row where 50% of the colony is fed; curves=True keeps every row
+    # record_every: seconds between two rows of a colony (also the resolution of the 50% fed time)
+    # checkpoint: directory where every completed task is saved as it comes; running the same sweep again with it
+    # skips those tasks (an unseeded sweep takes back the seed of the interrupted one)
+    # chunk: replicates per task, simulated together in one worker
+    # seed: int or SeedSequence; each grid cell gets a SeedSequence child, split again into one child per task, so the
+    # same seed and chunk give the same results whatever the number of workers (results.attrs['entropy'] keeps the
+    # root entropy of unseeded runs)
+    # cache: see AntVenture_cache.open_cache; tasks already simulated with the same seed are read from it (seed=None
+    # runs are never cached)
+    # writer: see AntVenture_io.open_writer (with columns sweep_columns(curves)); task results are streamed to it as
+    # they come instead of being kept in memory, and results is None
+    workers = workers or os.cpu_count()
+    cells = combi[grid_columns].to_dict('records')
+    chunk = min(chunk, n_sims)
+    if checkpoint is not None and seed is None:
+        seed = _checkpoint_seed(checkpoint)
+    root = _sweep_root(seed, None)
+    starts = range(0, n_sims, chunk)
+    tasks = [(i, np.arange(c, min(c + chunk, n_sims)), s)
+             for i, cell_seed in enumerate(root.spawn(len(cells))) for c, s in zip(starts, cell_seed.spawn(len(starts)))]
+    out = [None] * len(tasks)
+    warnings = {}
+    keys = [None] * len(tasks)
+    if cache is not None and seed is not None:
+        for n, (i, colonies, s) in enumerate(tasks):
+            keys[n] = _task_key(cells[i], colonies, time_sim, method_sb, curves, s, engine, record_every)
+            out[n] = cache_get(cache, keys[n])
+    if checkpoint is not None:
+        manifest = _sweep_manifest(cells, time_sim, n_sims, chunk, method_sb, curves, engine, record_every, root)
+        done = _open_checkpoint(checkpoint, manifest)
+        if done is None:
+            return None, "the checkpoint directory %s holds another sweep" % checkpoint
+        for n, res in done.items():
+            out[n] = res
+    todo = [n for n in range(len(tasks)) if out[n] is None]
+    if todo and resolve_engine(engine) == "compiled":
+        from AntVenture_kernel import warm_up
+        warm_up()  # compiled once here (or loaded from the disk cache); forked workers inherit it
+    if writer is not None:
+        writer["attrs"]["entropy"] = root.entropy
+        for n in range(len(tasks)):
+            if out[n] is not None:
+                write_rows(writer, out[n])
+                out[n] = None
+    t0 = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_run_cell, cells[tasks[n][0]], tasks[n][1], time_sim, method_sb, curves, tasks[n][2],
+                               engine, record_every): n for n in todo}
+        for done, fut in enumerate(as_completed(futures), 1):
+            n = futures[fut]
+            out[n], warn = fut.result()
+            if out[n] is None:
+                warnings[tasks[n][0]] = warn
+            else:
+                if keys[n] is not None:
+                    cache_put(cache, keys[n], out[n])
+                if checkpoint is not None:
+                    _save_task(checkpoint, n, out[n])
+                if writer is not None:
+                    write_rows(writer, out[n])
+                    out[n] = None
+            if progress:
+                _progress(done, len(todo), t0)
+    results = None
+    if writer is None:
+        columns = sweep_columns(curves)
+        out = [o for o in out if o is not None]
+        results = pd.DataFrame(np.vstack(out) if out else np.zeros((0, len(columns))), columns=columns)
+        results = results.astype({c: combi[c].dtype for c in grid_columns})
+        results.attrs['entropy'] = root.entropy
+    warning_message = "No errors found"
+    if warnings:
+        warning_message = "; ".join("cell %d %s: %s" % (i, cells[i], w) for i, w in sorted(warnings.items()))
+    return results, warning_message
+
+
+def cell_summary(results, target="time", ci=0.95, tol=None, relative=True):
+    # per grid cell: replicates, mean and sd of `target` ("time" or "fed" column of run_sweep/run_adaptive_sweep
+    # results) and the half width of its normal confidence interval; with tol, whether it is below tol (relative to the
+    # mean if relative)
+    z = NormalDist().inv_cdf(0.5 + ci / 2)
+    summary = results.groupby(grid_columns, sort=False)[target].agg(n="count", mean="mean", sd="std").reset_index()
+    summary["half_width"] = z * summary["sd"].fillna(np.inf) / np.sqrt(summary["n"])
+    if tol is not None:
+        summary["converged"] = summary["half_width"] <= tol * (summary["mean"].abs() if relative else 1)
+    return summary
+
+
+def _precision(values, z, tol, relative):
+    # half width of the confidence interval of the mean over the allowed one; <= 1 once the cell has converged
+    if len(values) < 2:
+        return np.inf
+    half_width = z * np.std(values, ddof=1) / np.sqrt(len(values))
+    allowed = tol * abs(np.mean(values)) if relative else tol
+    return half_width / allowed if allowed > 0 else (0 if half_width == 0 else np.inf)
+
+
+def run_adaptive_sweep(combi, time_sim=30, target="time", tol=0.05, relative=True, ci=0.95, batch=10, min_sims=20,
+                       max_sims=200, budget=None, method_sb="simple", workers=None, seed=None, progress=True,
+                       engine="auto", record_every=10):
+    # replicates of every grid cell in batches of `batch` colonies, until the confidence interval (ci) of the mean of
+    # target is within tol (relative to the mean if relative), with at least min_sims and at most max_sims colonies
+    # per cell; almost deterministic cells stop early and noisy ones get more replicates
+    # target: "time" (time to 50% fed, as run_sweep without curves; colonies that never get there count with the last
+    # recorded time) or "fed" (fed ants at the end of the simulation)
+    # budget: total colonies for the whole grid (None: no limit beyond max_sims); when cells compete for the last ones,
+    # the least precise go first. e.g. budget=len(combi) * n_sims spends what run_sweep(n_sims=n_sims) would
+    # Batch k of a cell always gets the same seed, so a seeded sweep without budget gives the same results whatever the
+    # number of workers. Returns (results, warning); results has the columns of run_sweep(curves=False), see
+    # cell_summary for the precision reached per cell
+    if target not in ("time", "fed"):
+        return None, "please choose a target: 'time' (time to 50% fed) or 'fed' (fed ants at the end)"
+    workers = workers or os.cpu_count()
+    cells = combi[grid_columns].to_dict('records')
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    cell_seeds = root.spawn(len(cells))
+    z = NormalDist().inv_cdf(0.5 + ci / 2)
+    column = -2 if target == "time" else -3  # rows end with fed, time, colony
+    budget = np.inf if budget is None else budget
+    out = [[] for _ in cells]
+    values = [np.zeros(0) for _ in cells]
+    runs = [0] * len(cells)  # colonies started per cell
+    warnings = {}
+    used = 0
+    if resolve_engine(engine) == "compiled":
+        from AntVenture_kernel import warm_up
+        warm_up()  # compiled once here (or loaded from the disk cache); forked workers inherit it
+    t0 = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        ready = list(range(len(cells)))  # cells whose batches are all done and that may need another one
+        while True:
+            for i in sorted(ready, key=lambda i: -_precision(values[i], z, tol, relative)):
+                if i in warnings or (len(values[i]) >= min_sims and _precision(values[i], z, tol, relative) <= 1):
+                    continue
+                # enough batches to reach min_sims at once, then one at a time
+                for _ in range(max(1, -(-(min_sims - runs[i]) // batch))):
+                    m = int(min(batch, max_sims - runs[i], budget - used))
+                    if m <= 0:
+                        break
+                    colonies = np.arange(runs[i], runs[i] + m)
+                    fut = pool.submit(_run_cell, cells[i], colonies, time_sim, method_sb, False,
+                                      cell_seeds[i].spawn(1)[0], engine, record_every,
+                                      0.5 if target == "time" else None)
+                    pending[fut] = i
+                    runs[i] += m
+                    used += m
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            ready = []
+            for fut in finished:
+                i = pending.pop(fut)
+                res, warn = fut.result()
+                if res is None:
+                    warnings[i] = warn
+                    continue
+                out[i].append(res)
+                values[i] = np.sort(np.append(values[i], res[:, column]))  # same precision whatever the order
+                if i not in pending.values():
+                    ready.append(i)
+            if progress:
+                done = sum(len(v) for v in values)
+                converged = sum(len(values[i]) >= min_sims and _precision(values[i], z, tol, relative) <= 1
+                                for i in range(len(cells)))
+                sys.stderr.write("\r%d colonies done, %d/%d cells converged, elapsed %.0fs " %
+                                 (done, converged, len(cells), time.time() - t0))
+                sys.stderr.flush()
+    if progress:
+        sys.stderr.write("\n")
+    columns = sweep_columns(False)
+    rows = [res[np.argsort(res[:, -1], kind="stable")] for res in (np.vstack(o) for o in out if o)]
+    results = pd.DataFrame(np.vstack(rows) if rows else np.zeros((0, len(columns))), columns=columns)
+    results = results.astype({c: combi[c].dtype for c in grid_columns})
+    results.attrs['entropy'] = root.entropy
+    warning_message = "No errors found"
+    if warnings:
+        warning_message = "; ".join("cell %d %s: %s" % (i, cells[i], w) for i, w in sorted(warnings.items()))
+    return results, warning_message
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run diacamma_model over a grid of conditions.")
+    for c in grid_columns:
+        parser.add_argument('--' + c, nargs='+', type=float if c == 'sugarcon' else int, default=default_grid[c])
+    parser.add_argument('--time-sim', type=int, default=30)
+    parser.add_argument('--n-sims', type=int, default=10, help="replicates per cell (adaptive: at least)")
+    parser.add_argument('--method-sb', choices=["simple", "complex"], default="simple")
+    parser.add_argument('--engine', choices=engines, default="auto")
+    parser.add_argument('--curves', action='store_true', help="keep full curves instead of the 50%% fed row")
+    parser.add_argument('--record-every', type=int, default=10, help="seconds between two results rows")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk', type=int, default=10, help="replicates per task")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default='example.csv')
+    parser.add_argument('--format', choices=('csv',) + formats, default='csv',
+                        help="npy/parquet: chunked columnar directory, see AntVenture_io.py")
+    parser.add_argument('--cache', default=None, help="result cache directory (runs with --seed only)")
+    parser.add_argument('--cache-mb', type=float, default=2048, help="size cap of the cache directory")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="replicates in batches of --chunk until the mean of --target is precise enough")
+    parser.add_argument('--target', choices=["time", "fed"], default="time",
+                        help="adaptive: time to 50%% fed, or fed ants at the end")
+    parser.add_argument('--tol', type=float, default=0.05,
+                        help="adaptive: half width of the 95%% CI relative to the mean")
+    parser.add_argument('--max-sims', type=int, default=200, help="adaptive: cap of replicates per cell")
+    parser.add_argument('--budget', type=int, default=None, help="adaptive: replicates for the whole grid")
+    parser.add_argument('--checkpoint', default=None,
+                        help="directory keeping completed tasks; rerun the same command to resume an interrupted sweep")
+    args = parser.parse_args(argv)
+    combi = sweep_grid(*(getattr(args, c) for c in grid_columns))
+    cache = None
+    if args.cache:
+        cache = open_cache(args.cache, max_bytes=int(args.cache_mb * 2 ** 20))
+    if args.adaptive:
+        results, warn = run_adaptive_sweep(combi, time_sim=args.time_sim, target=args.target, tol=args.tol,
+                                           batch=args.chunk, min_sims=args.n_sims, max_sims=args.max_sims,
+                                           budget=args.budget, method_sb=args.method_sb, workers=args.workers,
+                                           seed=args.seed, engine=args.engine, record_every=args.record_every)
+        if results is None:
+            sys.exit(warn)
+        print(warn)
+        print(cell_summary(results, args.target, tol=args.tol).to_string(index=False))
+        if args.format != 'csv':
+            write_results(args.output, results, args.format)
+        else:
+            results.to_csv(args.output, index=False)
+        return
+    if args.checkpoint:  # before the output is opened: a wrong checkpoint must not leave an empty output behind
+        warn = check_checkpoint(args.checkpoint, combi, time_sim=args.time_sim, n_sims=args.n_sims,
+                                method_sb=args.method_sb, curves=args.curves, chunk=args.chunk, seed=args.seed,
+                                engine=args.engine, record_every=args.record_every)
+        if warn is not None:
+            sys.exit(warn)
+    writer = None
+    if args.format != 'csv':
+        writer = open_writer(args.output, sweep_columns(args.curves), args.format)
+    results, warn = run_sweep(combi, time_sim=args.time_sim, n_sims=args.n_sims, method_sb=args.method_sb,
+                              curves=args.curves, workers=args.workers, chunk=args.chunk, seed=args.seed,
+                              engine=args.engine, cache=cache, writer=writer, record_every=args.record_every,
+                              checkpoint=args.checkpoint)
+    if results is None and writer is None:
+        sys.exit(warn)
+    print(warn)
+    if writer is not None:
+        close_writer(writer)
+    else:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# Headless entry point for AntVenture: Sims
+# Usage: python -m antventure run --N 80 --Nf 20 --D 100 --time-sim 600 --sugar 0.3 --behavior 0 --output run.csv
+#        python -m antventure sweep --workers 8 --n-sims 10 --output example.csv   (same options as AntVenture_sweep.py)
+#        python -m antventure serve --port 8765 --workers 4
+#        python -m antventure submit jobs.json --url http://127.0.0.1:8765
+# Only what a command needs is imported: a run imports numpy and the model, nothing else.
+# serve keeps a pool of worker processes with the model imported (and the compiled kernel warmed up) and answers
+# JSON jobs over localhost HTTP:
+#   POST /run   one job or a list of jobs, each a dict of diacamma_model arguments, e.g.
+#               {"N": 80, "Nf": 20, "D": 100, "time_sim": 600, "sugar": 0.3, "behavior": 0, "n_sims": 10, "seed": 1}
+#               -> {"columns": [...], "rows": [[...], ...], "warning": "No errors found"} per job
+#   GET /health
+
+import argparse
+import json
+import sys
+
+job_parameters = ("N", "Nf", "D", "time_sim", "visco", "sugar", "behavior", "terrain", "method_sb", "n_sims",
+                  "batched", "seed", "engine", "record_every")
+
+
+def run_model(job, checkpoint=None, checkpoint_every=600):
+    # job: dict of diacamma_model arguments; returns (rows sorted colony by colony, warning), rows None on error
+    # checkpoint: file to save the run to and resume it from (command line only, not for server jobs)
+    import numpy as np
+    from AntVenture_sims import iter_diacamma_model
+    unknown = sorted(set(job) - set(job_parameters))
+    if unknown:
+        return None, "unknown parameter(s): " + ", ".join(unknown)
+    missing = [k for k in job_parameters[:4] if k not in job]
+    if missing:
+        return None, "missing parameter(s): " + ", ".join(missing)
+    if job.get("n_sims", 1) < 0:
+        return None, "n_sims must be 0 or more"
+    rows, warning_message = iter_diacamma_model(**job, checkpoint=checkpoint, checkpoint_every=checkpoint_every)
+    if rows is None:
+        return None, warning_message
+    res = np.array(list(rows))
+    if len(res) == 0:  # n_sims=0
+        return np.empty((0, 7)), warning_message
+    return res[np.lexsort((res[:, 5], res[:, 6]))], warning_message
+
+
+def _run_job(job):
+    # worker task of the server: JSON-able answer to one job; jobs default to engine "auto", the workers having the
+    # kernel loaded already
+    from AntVenture_sims import results_columns
+    try:
+        rows, warning_message = run_model(dict({"engine": "auto"}, **job))
+    except Exception as e:  # bad parameter types or values: this job's error, the other jobs of the batch still answer
+        rows, warning_message = None, "%s: %s" % (type(e).__name__, e)
+    return {"columns": results_columns, "rows": None if rows is None else rows.tolist(), "warning": warning_message}
+
+
+def _init_worker():
+    # import the model (and compile the kernel) once per worker, before the first job
+    from AntVenture_sims import resolve_engine
+    if resolve_engine("auto") == "compiled":
+        from AntVenture_kernel import warm_up
+        warm_up()
+
+
+def _ping(_):
+    return True
+
+
+def serve(host="127.0.0.1", port=8765, workers=None):
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    workers = workers or os.cpu_count()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    list(pool.map(_ping, range(workers)))  # start (and warm) every worker now
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, answer):
+            body = json.dumps(answer).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self._reply(404, {"error": "unknown path " + self.path})
+            self._reply(200, {"status": "ok", "workers": workers})
+
+        def do_POST(self):
+            if self.path != "/run":
+                return self._reply(404, {"error": "unknown path " + self.path})
+            try:
+                jobs = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            except ValueError as e:
+                return self._reply(400, {"error": "invalid JSON: %s" % e})
+            single = isinstance(jobs, dict)
+            jobs = [jobs] if single else jobs
+            if not all(isinstance(j, dict) for j in jobs):
+                return self._reply(400, {"error": "a job is a JSON object of diacamma_model arguments"})
+            # small jobs travel to the workers in batches
+            answers = list(pool.map(_run_job, jobs, chunksize=max(1, len(jobs) // (4 * workers))))
+            self._reply(200, answers[0] if single else answers)
+
+        def log_message(self, format, *args):
+            sys.stderr.write("%s %s\n" % (self.address_string(), format % args))
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    sys.stderr.write("serving on http://%s:%d with %d workers\n" % (host, server.server_port, workers))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown()
+
+
+def submit(jobs, url="http://127.0.0.1:8765", timeout=None):
+    # sends one job (dict) or a list of jobs to a running server; returns its answer(s)
+    from urllib.request import Request, urlopen
+    req = Request(url.rstrip("/") + "/run", data=json.dumps(jobs).encode(),
+                  headers={"Content-Type": "application/json"})
+    with urlopen(req, timeout=timeout) as f:
+        return json.load(f)
+
+
+def _write_rows(rows, output):
+    import numpy as np
+    from AntVenture_sims import results_columns
+    np.savetxt(sys.stdout if output == "-" else output, rows, delimiter=",", fmt="%.10g",
+               header=",".join(results_columns), comments="")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["sweep"]:
+        from AntVenture_sweep import main as sweep_main
+        return sweep_main(argv[1:])
+    parser = argparse.ArgumentParser(prog="python -m antventure", description="AntVenture: Sims without the app.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="simulate one condition, results as CSV")
+    run.add_argument("--N", type=int, required=True, help="number of ants")
+    run.add_argument("--Nf", type=int, required=True, help="number of foragers")
+    run.add_argument("--D", type=int, required=True, help="distance to the food source")
+    run.add_argument("--time-sim", type=int, required=True, help="simulation time (s)")
+    food = run.add_mutually_exclusive_group(required=True)
+    food.add_argument("--sugar", type=float)
+    food.add_argument("--visco", type=float)
+    run.add_argument("--behavior", type=int, default=1, help="0: social bucket, 1: trophallaxis, 2: both")
+    run.add_argument("--terrain", type=int, default=0)
+    run.add_argument("--method-sb", choices=["simple", "complex"], default="simple")
+    run.add_argument("--n-sims", type=int, default=1)
+    run.add_argument("--seed", type=int, default=None)
+    run.add_argument("--engine", default="step", help="auto: compiled when Numba is installed (slower to start)")
+    run.add_argument("--record-every", type=int, default=10, help="seconds between two results rows")
+    run.add_argument("--output", default="-", help="CSV file, - for standard output")
+    run.add_argument("--checkpoint", default=None,
+                     help="file where the run is saved as it goes; rerun the same command to resume it")
+    run.add_argument("--checkpoint-every", type=float, default=600, help="seconds between two saves")
+    sub.add_parser("sweep", help="parameter sweep, see python AntVenture_sweep.py --help")
+    srv = sub.add_parser("serve", help="local job server with warm workers")
+    srv.add_argument("--host", default="127.0.0.1")
+    srv.add_argument("--port", type=int, default=8765)
+    srv.add_argument("--workers", type=int, default=None)
+    sbm = sub.add_parser("submit", help="send a JSON file of jobs to a running server")
+    sbm.add_argument("jobs", help="JSON file with one job or a list of jobs, - for standard input")
+    sbm.add_argument("--url", default="http://127.0.0.1:8765")
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        job = {"N": args.N, "Nf": args.Nf, "D": args.D, "time_sim": args.time_sim, "behavior": args.behavior,
+               "terrain": args.terrain, "method_sb": args.method_sb, "n_sims": args.n_sims, "seed": args.seed,
+               "engine": args.engine, "record_every": args.record_every}
+        job.update({"sugar": args.sugar} if args.sugar is not None else {"visco": args.visco})
+        rows, warning_message = run_model(job, args.checkpoint, args.checkpoint_every)
+        if rows is None:
+            sys.exit(warning_message)
+        _write_rows(rows, args.output)
+    elif args.command == "serve":
+        serve(args.host, args.port, args.workers)
+    elif args.command == "submit":
+        with (sys.stdin if args.jobs == "-" else open(args.jobs)) as f:
+            jobs = json.load(f)
+        json.dump(submit(jobs, args.url), sys.stdout)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()